@@ -1,45 +1,41 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
+from bedrock_invoke import invoke_text, stream_text
+from retrieval import retrieve, build_context
 import os
-import json
 import sys
 from dotenv import load_dotenv
 from subjects import get_subjects
 from chapters import get_chapters
+from topic_index import get_topics
+from common_operations import warn_if_retrieval_stale, regenerate_fresh_option, show_bulk_generation
+import content_cache
+from artifact_index import get_artifact_status, describe_artifact
 import io
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Image, PageTemplate, Frame, Table, HRFlowable
-from reportlab.lib.units import inch
-from reportlab.platypus import PageBreak, FrameBreak, NextPageTemplate, Spacer
+from static_assets import logo_image_reader
 
 
 
 load_dotenv()
 
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
+s3 = lazy_client('s3')
 
-bedrock_runtime = boto3.client('bedrock-runtime',
-                               aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                               aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                               region_name=os.getenv('AWS_REGION')
-                               )
 
-bedrock_agent_runtime = boto3.client(service_name='bedrock-agent-runtime', region_name=os.getenv('AWS_REGION'))
 
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 ARIFACTS_BUCKET_NAME = os.getenv('S3_ARTIFACTS_BUCKET_NAME')
-KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
 
 
 def generate_pdf(subject, chapter, topic, summary):
+    # reportlab is imported on first use to keep tool start-up fast
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Image, PageTemplate, Frame, Table, HRFlowable
+    from reportlab.lib.units import inch
+    from reportlab.platypus import PageBreak, FrameBreak, NextPageTemplate, Spacer
+
     buffer = io.BytesIO()
 
     def add_border_and_logo(canvas, doc):
@@ -50,10 +46,9 @@ def generate_pdf(subject, chapter, topic, summary):
         canvas.rect(20, 20, letter[0] - 40, letter[1] - 40)
 
         # Add logo
-        logo_path = "logo.png"
         logo_width = 1.5 * inch
         logo_height = 1.5 * inch
-        canvas.drawImage(logo_path, letter[0] - logo_width - 0.5 * inch, 0.5 * inch, width=logo_width,
+        canvas.drawImage(logo_image_reader(), letter[0] - logo_width - 0.5 * inch, 0.5 * inch, width=logo_width,
                          height=logo_height)
 
         canvas.restoreState()
@@ -109,10 +104,7 @@ def generate_pdf(subject, chapter, topic, summary):
 def get_pdf_summary(subject, chapter, topic):
     key = f"{subject}/{chapter}/{topic}/Elaborate.pdf"
     try:
-        response = s3.get_object(Bucket=ARIFACTS_BUCKET_NAME, Key=key)
-        return response['Body'].read()
-    except s3.exceptions.NoSuchKey:
-        return None
+        return content_cache.get_object_bytes(ARIFACTS_BUCKET_NAME, key)
     except Exception as e:
         print(f"Error retrieving PDF summary: {str(e)}")
         return None
@@ -129,39 +121,16 @@ def get_presigned_url(bucket_name, object_key, expiration=3600):
         return None
 
 
-def get_topics(subject, chapter):
-    subject_metadata_key = f"{subject}/subject_metadata.json"
-    try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=subject_metadata_key)
-        subject_metadata = json.loads(response['Body'].read().decode('utf-8'))
-        topics = []
-        for file_info in subject_metadata.get('files', []):
-            if file_info['chapter'] == chapter:
-                topics.extend(file_info.get('topics', '').split('\n'))
-        return [topic.strip() for topic in topics if topic.strip()]
-    except s3.exceptions.NoSuchKey:
-        return []
-
-def generate_topic_summary(subject, chapter, topic):
+def summary_prompt(subject, chapter, topic):
     query = f"""For the following:
     Subject: {subject}
     Chapter: {chapter}
     Topic: {topic}
     Retrieve the relative Information
     """
-    response = bedrock_agent_runtime.retrieve(
-        knowledgeBaseId=KNOWLEDGE_BASE_ID,
-        retrievalQuery={'text': query},
-        retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 10}}
-    )
-
-    context = "Based on the following information:\n\n"
-    for result in response['retrievalResults']:
-        if 'text' in result['content']:
-            context += f"- {result['content']['text']}\n"
-        elif 'byteContent' in result['content']:
-            content_type = result['content']['byteContent'].split(';')[0].split(':')[1]
-            context += f"- [Content of type: {content_type}]\n"
+    results = retrieve(query, number_of_results=10)
+
+    context = build_context(results)
 
     prompt = f"""{context}
     You are a Tutor for a High-Education University.
@@ -169,20 +138,16 @@ def generate_topic_summary(subject, chapter, topic):
     Use your knowledge to explain and simplify the mentioned topics. Give examples and Elaborate.
     """
 
-    bedrock_response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 2000,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "top_p": 1.0,
-        })
-    )
-    response_body = json.loads(bedrock_response['body'].read())
-    return response_body['content'][0]['text'].strip()
+    return prompt
+
+
+def generate_topic_summary(subject, chapter, topic, fresh=False):
+    return invoke_text(summary_prompt(subject, chapter, topic), max_tokens=2000, fresh=fresh)
+
+
+def stream_topic_summary(subject, chapter, topic, fresh=False):
+    # Yields the summary as it is generated; st.write_stream returns the full text
+    return stream_text(summary_prompt(subject, chapter, topic), max_tokens=2000, fresh=fresh)
 
 
 def save_summary(subject, chapter, topic, summary):
@@ -198,15 +163,16 @@ def save_summary(subject, chapter, topic, summary):
         return True
     except Exception as e:
         return False
+    finally:
+        content_cache.invalidate(ARIFACTS_BUCKET_NAME, text_key)
+        content_cache.invalidate(ARIFACTS_BUCKET_NAME, pdf_key)
 
 
 def get_summary(subject, chapter, topic):
     key = f"{subject}/{chapter}/{topic}/Elaborate.txt"
     try:
-        response = s3.get_object(Bucket=ARIFACTS_BUCKET_NAME, Key=key)
-        return response['Body'].read().decode('utf-8')
-    except s3.exceptions.NoSuchKey:
-        return None
+        body = content_cache.get_object_bytes(ARIFACTS_BUCKET_NAME, key)
+        return body.decode('utf-8') if body is not None else None
     except Exception as e:
         print(f"Error retrieving summary: {str(e)}")
         return None
@@ -221,6 +187,9 @@ def delete_summary(subject, chapter, topic):
     except Exception as e:
         print(f"Error deleting summary: {str(e)}")
         raise
+    finally:
+        content_cache.invalidate(ARIFACTS_BUCKET_NAME, text_key)
+        content_cache.invalidate(ARIFACTS_BUCKET_NAME, pdf_key)
 
 def ElaborativeOutputyCreator():
     with st.expander("📚 Click here for Tool Instructions"):
@@ -261,20 +230,27 @@ def ElaborativeOutputyCreator():
         chapters = [""] + get_chapters(subject)
         chapter = st.selectbox("Select Chapter", chapters, key=f"chapter2_{st.session_state.refresh_key}")
         if chapter:
+            warn_if_retrieval_stale()
+            fresh = regenerate_fresh_option("elaborate_fresh")
+            show_bulk_generation("elaborate", "Elaborate.txt", subject, chapter, chapters[1:],
+                                 generate_topic_summary, save_summary)
             topics = get_topics(subject, chapter)
             st.subheader("Topics")
+            # Existence, size and date of every artifact in the chapter from a single listing
+            artifacts = get_artifact_status(subject, chapter)
 
             for topic in topics:
-                summary_exists = get_summary(subject, chapter, topic) is not None
+                topic_artifacts = artifacts.get(topic, {})
+                summary_exists = 'Elaborate.txt' in topic_artifacts
                 expander_label = f"⬤ {topic}" if summary_exists else f"◯ {topic}"
 
                 with st.expander(expander_label):
                     col1, col2, col3 = st.columns([2, 1, 1])
                     pdf_key = f"{subject}/{chapter}/{topic}/Elaborate.pdf"
-                    pdf_exists = get_pdf_summary(subject, chapter, topic) is not None
+                    pdf_exists = 'Elaborate.pdf' in topic_artifacts
 
                     with col1:
-                        st.write("Extra Explanation status: " + ("Exists" if summary_exists else "Not available"))
+                        st.write("Extra Explanation status: " + describe_artifact(topic_artifacts.get('Elaborate.txt')))
 
                     with col2:
                         if summary_exists:
@@ -308,9 +284,10 @@ def ElaborativeOutputyCreator():
                 st.subheader(f"Extra Explanation for: {topic}")
 
                 if st.session_state.action == "generate":
-                    with st.spinner("Generating more explanation and examples ..."):
-                        generated_summary = generate_topic_summary(subject, chapter, topic)
-                        st.session_state.current_summary = generated_summary
+                    # Tokens are shown as they arrive; the finished text then fills the editor below
+                    with st.container(border=True):
+                        generated_summary = st.write_stream(stream_topic_summary(subject, chapter, topic, fresh))
+                    st.session_state.current_summary = generated_summary.strip()
                     st.success("Elaborative Output has been generated. You can now edit and save it.")
                     st.session_state.action = "view"
 
@@ -1,45 +1,38 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
+from bedrock_invoke import invoke_text, stream_text, CLAUDE_V2
 import os
 import json
 from dotenv import load_dotenv
 from subjects import get_subjects
 from chapters import get_chapters
-import requests
+from s3_listing import iter_keys
+import content_cache
 import uuid
 import io
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable
-from reportlab.lib.units import inch
+from static_assets import logo_image_reader
+from common_operations import regenerate_fresh_option
 
 
 load_dotenv()
 
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
-
-transcribe = boto3.client('transcribe',
-                          aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                          aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                          region_name=os.getenv('AWS_REGION')
-                          )
-
-bedrock_runtime = boto3.client('bedrock-runtime',
-                               aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                               aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                               region_name=os.getenv('AWS_REGION')
-                               )
+s3 = lazy_client('s3')
+
+transcribe = lazy_client('transcribe')
+
 
 SOURCE_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 MEDIA_BUCKET_NAME = os.getenv('S3_ARTIFACTS_BUCKET_NAME')
 
 def generate_pdf(subject, chapter, video_name, summary):
+    # reportlab is imported on first use to keep tool start-up fast
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable
+    from reportlab.lib.units import inch
+
     buffer = io.BytesIO()
 
     def add_border_and_logo(canvas, doc):
@@ -50,10 +43,9 @@ def generate_pdf(subject, chapter, video_name, summary):
         canvas.rect(20, 20, letter[0] - 40, letter[1] - 40)
 
         # Add logo
-        logo_path = "logo.png"
         logo_width = 1.5 * inch
         logo_height = 1.5 * inch
-        canvas.drawImage(logo_path, letter[0] - logo_width - 0.5 * inch, 0.5 * inch, width=logo_width,
+        canvas.drawImage(logo_image_reader(), letter[0] - logo_width - 0.5 * inch, 0.5 * inch, width=logo_width,
                          height=logo_height)
 
         canvas.restoreState()
@@ -109,6 +101,7 @@ def save_pdf_asset(subject, chapter, video_name, content):
     ensure_folder_exists(MEDIA_BUCKET_NAME, folder_path)
     key = f"{folder_path}/summary.pdf"
     s3.put_object(Bucket=MEDIA_BUCKET_NAME, Key=key, Body=content.getvalue())
+    content_cache.invalidate(MEDIA_BUCKET_NAME, key)
 
 
 def get_video_url(bucket, key):
@@ -128,13 +121,15 @@ def ensure_folder_exists(bucket, folder_path):
 
 def get_video_files(subject, chapter):
     prefix = f"{subject}/{chapter}/DeliveredLectures/"
-    ensure_folder_exists(MEDIA_BUCKET_NAME, prefix)
-    response = s3.list_objects_v2(Bucket=MEDIA_BUCKET_NAME, Prefix=prefix)
-    video_files = [obj['Key'] for obj in response.get('Contents', []) if obj['Key'].endswith(('.mp4', '.avi', '.mov'))]
+    keys = list(iter_keys(s3, MEDIA_BUCKET_NAME, prefix))
+    if not keys:
+        ensure_folder_exists(MEDIA_BUCKET_NAME, prefix)
+    video_files = [key for key in keys if key.endswith(('.mp4', '.avi', '.mov'))]
     return video_files
 
 
 def create_transcription(video_file):
+    import requests
     # Generate a unique job name by including a UUID
     job_name = f"transcribe_{os.path.basename(video_file)}_{uuid.uuid4().hex[:8]}"
     job_uri = f"s3://{MEDIA_BUCKET_NAME}/{video_file}"
@@ -162,34 +157,27 @@ def create_transcription(video_file):
         return None
 
 
-def generate_summary(transcript):
-    prompt = f"Human: Summarize the following lecture transcript:\n\n{transcript}\n\nAssistant: Here's a summary of the lecture transcript:"
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-v2",
-        body=json.dumps({
-            "prompt": prompt,
-            "max_tokens_to_sample": 500,
-            "temperature": 0.5,
-            "top_p": 1,
-            "stop_sequences": ["\n\nHuman:"]
-        })
-    )
-    return json.loads(response['body'].read())['completion']
-
-
-def generate_flashcards(transcript):
-    prompt = f"Human: Create 5 flashcards with key statements from this lecture transcript. Format each flashcard as 'Front: [content]' and 'Back: [content]' on separate lines:\n\n{transcript}\n\nAssistant: Here are 5 flashcards based on the lecture transcript:"
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-v2",
-        body=json.dumps({
-            "prompt": prompt,
-            "max_tokens_to_sample": 500,
-            "temperature": 0.5,
-            "top_p": 1,
-            "stop_sequences": ["\n\nHuman:"]
-        })
-    )
-    flashcards_text = json.loads(response['body'].read())['completion']
+# The replies continue these openings, as they did when the prompts were completions
+SUMMARY_PREFILL = "Here's a summary of the lecture transcript:"
+
+
+def generate_summary(transcript, fresh=False):
+    prompt = f"Summarize the following lecture transcript:\n\n{transcript}"
+    return invoke_text(prompt, max_tokens=500, model_id=CLAUDE_V2, temperature=0.5, fresh=fresh,
+                       prefill=SUMMARY_PREFILL)
+
+
+def stream_summary(transcript, fresh=False):
+    # Yields the summary as it is generated; st.write_stream returns the full text
+    prompt = f"Summarize the following lecture transcript:\n\n{transcript}"
+    return stream_text(prompt, max_tokens=500, model_id=CLAUDE_V2, temperature=0.5, fresh=fresh,
+                       prefill=SUMMARY_PREFILL)
+
+
+def generate_flashcards(transcript, fresh=False):
+    prompt = f"Create 5 flashcards with key statements from this lecture transcript. Format each flashcard as 'Front: [content]' and 'Back: [content]' on separate lines:\n\n{transcript}"
+    flashcards_text = invoke_text(prompt, max_tokens=500, model_id=CLAUDE_V2, temperature=0.5, fresh=fresh,
+                                  prefill="Here are 5 flashcards based on the lecture transcript:")
 
     # Parse the flashcards into a list of dictionaries
     flashcards = []
@@ -208,19 +196,10 @@ def generate_flashcards(transcript):
     return flashcards
 
 
-def extract_assignments(transcript):
-    prompt = f"Human: Extract any assignments or homework mentioned in this lecture transcript:\n\n{transcript}\n\nAssistant: Here are the assignments or homework mentioned in the lecture transcript:"
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-v2",
-        body=json.dumps({
-            "prompt": prompt,
-            "max_tokens_to_sample": 500,
-            "temperature": 0.5,
-            "top_p": 1,
-            "stop_sequences": ["\n\nHuman:"]
-        })
-    )
-    return json.loads(response['body'].read())['completion']
+def extract_assignments(transcript, fresh=False):
+    prompt = f"Extract any assignments or homework mentioned in this lecture transcript:\n\n{transcript}"
+    return invoke_text(prompt, max_tokens=500, model_id=CLAUDE_V2, temperature=0.5, fresh=fresh,
+                       prefill="Here are the assignments or homework mentioned in the lecture transcript:")
 
 
 
@@ -231,9 +210,11 @@ def save_asset(subject, chapter, video_name, asset_type, content):
         for i, card in enumerate(content):
             key = f"{folder_path}/flashcard_{i+1}.json"
             s3.put_object(Bucket=MEDIA_BUCKET_NAME, Key=key, Body=json.dumps(card))
+            content_cache.invalidate(MEDIA_BUCKET_NAME, key)
     else:
         key = f"{folder_path}/{asset_type}.txt"
         s3.put_object(Bucket=MEDIA_BUCKET_NAME, Key=key, Body=content.encode('utf-8'))
+        content_cache.invalidate(MEDIA_BUCKET_NAME, key)
 
 
 
@@ -244,20 +225,16 @@ def get_asset(subject, chapter, video_name, asset_type):
         i = 1
         while True:
             key = f"{folder_path}/flashcard_{i}.json"
-            try:
-                response = s3.get_object(Bucket=MEDIA_BUCKET_NAME, Key=key)
-                flashcards.append(json.loads(response['Body'].read().decode('utf-8')))
-                i += 1
-            except s3.exceptions.NoSuchKey:
+            body = content_cache.get_object_bytes(MEDIA_BUCKET_NAME, key)
+            if body is None:
                 break
+            flashcards.append(json.loads(body.decode('utf-8')))
+            i += 1
         return flashcards if flashcards else None
     else:
         key = f"{subject}/{chapter}/DeliveredLectures/{video_name}/{asset_type}.txt"
-        try:
-            response = s3.get_object(Bucket=MEDIA_BUCKET_NAME, Key=key)
-            return response['Body'].read().decode('utf-8')
-        except s3.exceptions.NoSuchKey:
-            return None
+        body = content_cache.get_object_bytes(MEDIA_BUCKET_NAME, key)
+        return body.decode('utf-8') if body is not None else None
 
 
 def flashcard_html(front, back):
@@ -430,6 +407,7 @@ def lecture_analyzer():
                                             )
 
                         st.subheader("Create New Assets")
+                        fresh = regenerate_fresh_option("lecture_fresh")
                         col1, col2, col3, col4 = st.columns(4)
 
                         with col1:
@@ -443,24 +421,25 @@ def lecture_analyzer():
 
                         with col2:
                             if st.button("Generate Summary"):
-                                with st.spinner("Generating summary..."):
-                                    transcript = get_asset(subject, chapter, video_name, 'transcription')
-                                    if transcript:
-                                        summary = generate_summary(transcript)
+                                transcript = get_asset(subject, chapter, video_name, 'transcription')
+                                if transcript:
+                                    # The summary is shown as it is generated, then saved
+                                    summary = st.write_stream(stream_summary(transcript, fresh)).strip()
+                                    with st.spinner("Saving summary..."):
                                         save_asset(subject, chapter, video_name, 'summary', summary)
                                         pdf_buffer = generate_pdf(subject, chapter, video_name, summary)
                                         save_pdf_asset(subject, chapter, video_name, pdf_buffer)
-                                        st.success("Summary generated and saved successfully!")
-                                        st.rerun()
-                                    else:
-                                        st.error("Transcript not found. Please generate the transcript first.")
+                                    st.success("Summary generated and saved successfully!")
+                                    st.rerun()
+                                else:
+                                    st.error("Transcript not found. Please generate the transcript first.")
 
                         with col3:
                             if st.button("Generate Flashcards"):
                                 with st.spinner("Generating flashcards..."):
                                     transcript = get_asset(subject, chapter, video_name, 'transcription')
                                     if transcript:
-                                        flashcards = generate_flashcards(transcript)
+                                        flashcards = generate_flashcards(transcript, fresh)
                                         save_asset(subject, chapter, video_name, 'flashcards', flashcards)
                                         st.success("Flashcards generated and saved successfully!")
                                         st.rerun()
@@ -472,7 +451,7 @@ def lecture_analyzer():
                                 with st.spinner("Generating assignments..."):
                                     transcript = get_asset(subject, chapter, video_name, 'transcription')
                                     if transcript:
-                                        assignments = extract_assignments(transcript)
+                                        assignments = extract_assignments(transcript, fresh)
                                         save_asset(subject, chapter, video_name, 'assignments', assignments)
                                         pdf_buffer = generate_pdf(subject, chapter, video_name, assignments)
                                         save_pdf_asset(subject, chapter, video_name, pdf_buffer)
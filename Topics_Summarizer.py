@@ -1,11 +1,12 @@
 import streamlit as st
-import boto3
-import os
+from bedrock_invoke import invoke_text
+from retrieval import retrieve, build_context
 from dotenv import load_dotenv
 from subjects import get_subjects
 from chapters import get_chapters
 from files import get_files, update_subject_metadata
-import json
+from metadata_store import get_file_record
+from common_operations import warn_if_retrieval_stale, regenerate_fresh_option
 from uuid import uuid4
 import logging
 
@@ -14,78 +15,34 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-if 'new_topics' not in st.session_state:
-    st.session_state.new_topics = ""
-
-# Initialize AWS clients
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION')
-)
-
-bedrock_runtime = boto3.client(
-    'bedrock-runtime',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION')
-)
-
-bedrock_agent_runtime = boto3.client(
-    service_name='bedrock-agent-runtime',
-    region_name=os.getenv('AWS_REGION')
-)
-
-BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
-KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
-
-def generate_topics(subject, chapter, filename):
-    logger.info(f"Generating topics for {subject} - {chapter} - {filename}")
+def topics_prompt(subject, chapter, filename):
     query = f"""Generate a bulleted list of the main topics covered in the document:
     Subject: {subject}
     Chapter: {chapter}
     Filename: {filename}
     """
-    try:
-        response = bedrock_agent_runtime.retrieve(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            retrievalQuery={'text': query},
-            retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 5}}
-        )
-        logger.info("Successfully retrieved from knowledge base")
-    except Exception as e:
-        logger.error(f"Error retrieving from knowledge base: {str(e)}")
-        return None
+    results = retrieve(query, number_of_results=5)
+    logger.info("Successfully retrieved from knowledge base")
 
-    context = "Based on the following information:\n\n"
-    for result in response['retrievalResults']:
-        if 'text' in result['content']:
-            context += f"- {result['content']['text']}\n"
-        elif 'byteContent' in result['content']:
-            content_type = result['content']['byteContent'].split(';')[0].split(':')[1]
-            context += f"- [Content of type: {content_type}]\n"
+    context = build_context(results)
 
-    prompt = f"""{context}
+    return f"""{context}
     Return a bulleted list of the main topics covered in this context.
     """
 
+
+def generate_topics(subject, chapter, filename, fresh=False):
+    logger.info(f"Generating topics for {subject} - {chapter} - {filename}")
     try:
-        bedrock_response = bedrock_runtime.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.3,
-                "top_p": 1.0,
-            })
-        )
+        prompt = topics_prompt(subject, chapter, filename)
+    except Exception as e:
+        logger.error(f"Error retrieving from knowledge base: {str(e)}")
+        return None
+
+    try:
+        topics = invoke_text(prompt, max_tokens=1000, fresh=fresh)
         logger.info("Successfully invoked Bedrock model")
-        response_body = json.loads(bedrock_response['body'].read())
-        return response_body['content'][0]['text'].strip()
+        return topics
     except Exception as e:
         logger.error(f"Error invoking Bedrock model: {str(e)}")
         return None
@@ -111,6 +68,9 @@ def topicsSummary():
         """)
     logger.info("Starting Topics Manager")
 
+    if 'new_topics' not in st.session_state:
+        st.session_state.new_topics = ""
+
     TOPICS_KEY = "topics_manager_current_topics"
 
     if TOPICS_KEY not in st.session_state:
@@ -126,32 +86,22 @@ def topicsSummary():
 
         if chapter:
             logger.info(f"Selected chapter: {chapter}")
+            warn_if_retrieval_stale()
             files = [""] + get_files(subject, chapter)
             file = st.selectbox("Select Document", files, key="topicsSummaryfilesSelection")
 
             if file:
                 logger.info(f"Selected file: {file}")
 
-                subject_metadata_key = f"{subject}/subject_metadata.json"
                 try:
-                    response = s3.get_object(Bucket=BUCKET_NAME, Key=subject_metadata_key)
-                    subject_metadata = json.loads(response['Body'].read().decode('utf-8'))
-
-                    file_info = next(
-                        (item for item in subject_metadata.get('files', [])
-                         if item['filename'] == file and item['chapter'] == chapter),
-                        None
-                    )
+                    file_info = get_file_record(subject, chapter, file)
 
                     if file_info:
-                        st.session_state[TOPICS_KEY] = file_info.get('topics', '')
+                        st.session_state[TOPICS_KEY] = file_info.get('topics') or ''
                     else:
                         st.session_state[TOPICS_KEY] = ''
 
                     logger.info("Successfully loaded topics from S3 for this file")
-                except s3.exceptions.NoSuchKey:
-                    logger.info("No saved topics found for this file")
-                    st.session_state[TOPICS_KEY] = ''
                 except Exception as e:
                     logger.error(f"Error loading saved topics: {str(e)}")
                     st.session_state[TOPICS_KEY] = ''
@@ -179,10 +129,11 @@ def topicsSummary():
                             logger.error(f"Error saving topics: {str(e)}")
 
                 with col2:
+                    fresh = regenerate_fresh_option("topics_fresh")
                     if st.button("Generate New Topics"):
                         logger.info("Generating new topics")
                         try:
-                            new_topics = generate_topics(subject, chapter, file)
+                            new_topics = generate_topics(subject, chapter, file, fresh)
                             if new_topics:
                                 st.session_state.new_topics = new_topics
                                 st.success("New topics generated successfully.")
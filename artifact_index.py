@@ -0,0 +1,27 @@
+import os
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+from s3_listing import iter_objects
+
+load_dotenv()
+
+s3 = lazy_client('s3')
+ARTIFACTS_BUCKET_NAME = os.getenv('S3_ARTIFACTS_BUCKET_NAME')
+
+
+def get_artifact_status(subject, chapter):
+    # One listing of {subject}/{chapter}/ in the artifacts bucket answers, for every topic,
+    # which artifacts exist: {topic: {"summary.txt": {"size": ..., "last_modified": ...}, ...}}
+    prefix = f"{subject}/{chapter}/"
+    status = {}
+    for obj in iter_objects(s3, ARTIFACTS_BUCKET_NAME, prefix):
+        topic, _, name = obj['Key'][len(prefix):].rpartition('/')
+        if topic and name:
+            status.setdefault(topic, {})[name] = {'size': obj['Size'], 'last_modified': obj['LastModified']}
+    return status
+
+
+def describe_artifact(info):
+    if not info:
+        return "Not available"
+    return f"Exists ({info['size'] / 1024:.1f} KB, updated {info['last_modified']:%Y-%m-%d %H:%M})"
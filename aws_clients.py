@@ -0,0 +1,83 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One client per service for the whole process. boto3 clients are thread-safe, so every
+# module and Streamlit session shares the same connection pool and resolved credentials.
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', '5'))
+
+# Per-service (connect, read) timeouts in seconds
+SERVICE_TIMEOUTS = {
+    's3': (5, 60),
+    'bedrock-runtime': (5, 300),
+    'bedrock-agent-runtime': (5, 60),
+    'bedrock-agent': (5, 60),
+    'transcribe': (5, 60),
+}
+DEFAULT_TIMEOUTS = (5, 60)
+
+_session = None
+_clients = {}
+# Service name -> client used instead of the real one, e.g. a local stand-in
+_overrides = {}
+_lock = threading.Lock()
+
+
+def _create_client(service_name, config_overrides):
+    # boto3 is imported here so that importing this module stays cheap
+    import boto3
+    from botocore.config import Config
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                                         aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                                         region_name=os.getenv('AWS_REGION'))
+    connect_timeout, read_timeout = SERVICE_TIMEOUTS.get(service_name, DEFAULT_TIMEOUTS)
+    config = Config(max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=True,
+                    retries={'mode': 'adaptive', 'max_attempts': AWS_MAX_ATTEMPTS},
+                    connect_timeout=connect_timeout,
+                    read_timeout=read_timeout)
+    if config_overrides:
+        config = config.merge(Config(**config_overrides))
+    return _session.client(service_name, config=config)
+
+
+def get_client(service_name, **config_overrides):
+    override = _overrides.get(service_name)
+    if override is not None:
+        return override
+    key = (service_name, repr(sorted(config_overrides.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _create_client(service_name, config_overrides)
+    return client
+
+
+def set_client(service_name, client):
+    # Routes every client of the service, in every module, to `client`; None restores the real one
+    with _lock:
+        if client is None:
+            _overrides.pop(service_name, None)
+        else:
+            _overrides[service_name] = client
+
+
+class LazyClient:
+    # Module-level stand-in for a boto3 client; the shared client is created on first use
+    def __init__(self, service_name, **config_overrides):
+        self._service_name = service_name
+        self._config_overrides = config_overrides
+
+    def __getattr__(self, name):
+        return getattr(get_client(self._service_name, **self._config_overrides), name)
+
+
+def lazy_client(service_name, **config_overrides):
+    return LazyClient(service_name, **config_overrides)
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+import aws_clients
+from aws_clients import lazy_client
+from s3_listing import iter_keys
+from bedrock_invoke import DEFAULT_TEXT_MODEL, messages_body, response_text, invoke_text
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Offline generation of a whole subject with Bedrock batch inference. Prompts for every
+# pending item (topic summaries, elaborations, topic extraction) are written as JSONL to
+# the artifacts bucket, submitted as one model invocation job, and the outputs are saved
+# through each tool's own save function, so results land in the usual
+# {subject}/{chapter}/{topic}/summary.txt / Elaborate.txt / PDF layout.
+s3 = lazy_client('s3')
+bedrock = lazy_client('bedrock')
+ARTIFACTS_BUCKET_NAME = os.getenv('S3_ARTIFACTS_BUCKET_NAME')
+BEDROCK_BATCH_ROLE_ARN = os.getenv('BEDROCK_BATCH_ROLE_ARN')
+
+BATCH_PREFIX = 'batch-inference/'
+# Bedrock rejects batch jobs below this many records; smaller runs are generated online
+BATCH_MIN_RECORDS = 100
+BATCH_PROMPT_WORKERS = 8
+BATCH_POLL_MIN_SECONDS = 30.0
+BATCH_POLL_MAX_SECONDS = 600.0
+
+_FINISHED_JOB_STATUSES = ('Completed', 'PartiallyCompleted', 'Failed', 'Stopped', 'Expired')
+
+USAGE = """Usage:
+  python batch_inference.py SUBJECT [--kinds summary,elaboration,topics]
+  python batch_inference.py --collect JOB_ARN"""
+
+
+class BatchKind:
+    # One kind of generated content. pending(subject) lists item tuples such as
+    # (chapter, topic); prompt(subject, *item) builds the prompt; save(subject, *item, text)
+    # stores the result and returns True on success.
+    __slots__ = ('name', 'pending', 'prompt', 'save', 'max_tokens')
+
+    def __init__(self, name, pending, prompt, save, max_tokens):
+        self.name = name
+        self.pending = pending
+        self.prompt = prompt
+        self.save = save
+        self.max_tokens = max_tokens
+
+
+def set_clients(s3_client=None, bedrock_client=None, runtime_client=None, agent_runtime_client=None,
+                agent_client=None):
+    # Replaces the AWS clients of the whole pipeline, e.g. with local stand-ins: S3 for the
+    # pending-work indexes, prompt files and saved artifacts, the Bedrock job API, the
+    # runtime used for online generation, the agent runtime used for retrieval and the
+    # agent API that tells retrieval which ingestion jobs have completed.
+    # The clients are set process-wide, so the tools' own functions use them too.
+    for service_name, client in (('s3', s3_client), ('bedrock', bedrock_client),
+                                 ('bedrock-runtime', runtime_client),
+                                 ('bedrock-agent-runtime', agent_runtime_client),
+                                 ('bedrock-agent', agent_client)):
+        if client is not None:
+            aws_clients.set_client(service_name, client)
+
+
+def default_kinds():
+    # The tools are imported here, not at module level, so they only load for a run
+    import topicSummaryCreator
+    import Elaborate
+    import Topics_Summarizer
+    from chapters import get_chapters
+    from files import get_files, update_subject_metadata
+    from metadata_store import list_chapter_records
+    from bulk_generation import missing_topics
+
+    def files_without_topics(subject):
+        pending = []
+        for chapter in get_chapters(subject):
+            with_topics = {record['filename'] for record in list_chapter_records(subject, chapter)
+                           if (record.get('topics') or '').strip()}
+            pending += [(chapter, filename) for filename in get_files(subject, chapter) if filename not in with_topics]
+        return pending
+
+    def save_topics(subject, chapter, filename, topics):
+        update_subject_metadata(subject, chapter, filename, action='update', topics=topics)
+        return True
+
+    return {
+        'topics': BatchKind('topics', files_without_topics, Topics_Summarizer.topics_prompt, save_topics, 1000),
+        'summary': BatchKind('summary', lambda subject: missing_topics(subject, get_chapters(subject), 'summary.txt'),
+                             topicSummaryCreator.summary_prompt, topicSummaryCreator.save_summary, 1000),
+        'elaboration': BatchKind('elaboration',
+                                 lambda subject: missing_topics(subject, get_chapters(subject), 'Elaborate.txt'),
+                                 Elaborate.summary_prompt, Elaborate.save_summary, 2000),
+    }
+
+
+def build_records(subject, kinds):
+    # Returns (records, manifest): JSONL records and recordId -> [kind name, *item]
+    tasks = [(kind, item) for kind in kinds for item in kind.pending(subject)]
+    records, manifest = [], {}
+    with ThreadPoolExecutor(max_workers=BATCH_PROMPT_WORKERS) as executor:
+        futures = {executor.submit(kind.prompt, subject, *item): (kind, item) for kind, item in tasks}
+        for future in as_completed(futures):
+            kind, item = futures[future]
+            try:
+                prompt = future.result()
+            except Exception as e:
+                logger.error(f"Could not build the {kind.name} prompt for {item}: {str(e)}")
+                continue
+            record_id = f"r{len(records):09d}"
+            records.append({"recordId": record_id, "modelInput": messages_body(prompt, kind.max_tokens)})
+            manifest[record_id] = [kind.name, *item]
+    return records, manifest
+
+
+def _s3_uri(key):
+    return f"s3://{ARTIFACTS_BUCKET_NAME}/{key}"
+
+
+def submit(subject, records, manifest, model_id=None):
+    # Uploads the prompts and starts the job; returns the job ARN
+    job_name = f"aiforlecture-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}"
+    job_prefix = f"{BATCH_PREFIX}{job_name}/"
+    body = "\n".join(json.dumps(record, ensure_ascii=False) for record in records)
+    s3.put_object(Bucket=ARTIFACTS_BUCKET_NAME, Key=f"{job_prefix}input/records.jsonl", Body=body.encode('utf-8'))
+    # The manifest maps each record back to its item, so outputs can be collected later
+    s3.put_object(Bucket=ARTIFACTS_BUCKET_NAME, Key=f"{job_prefix}manifest.json",
+                  Body=json.dumps({"subject": subject, "records": manifest}, ensure_ascii=False).encode('utf-8'))
+    response = bedrock.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=BEDROCK_BATCH_ROLE_ARN,
+        modelId=model_id or DEFAULT_TEXT_MODEL,
+        inputDataConfig={'s3InputDataConfig': {'s3Uri': _s3_uri(f"{job_prefix}input/records.jsonl"),
+                                               's3InputFormat': 'JSONL'}},
+        outputDataConfig={'s3OutputDataConfig': {'s3Uri': _s3_uri(f"{job_prefix}output/")}})
+    logger.info(f"Submitted batch job {job_name} with {len(records)} records: {response['jobArn']}")
+    return response['jobArn']
+
+
+def wait(job_arn):
+    delay = BATCH_POLL_MIN_SECONDS
+    while True:
+        job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+        if job['status'] in _FINISHED_JOB_STATUSES:
+            logger.info(f"Batch job {job['jobName']} finished with status {job['status']}")
+            return job
+        logger.info(f"Batch job {job['jobName']} is {job['status']}")
+        time.sleep(delay)
+        delay = min(delay * 2, BATCH_POLL_MAX_SECONDS)
+
+
+def collect(job_arn, kinds):
+    # Saves every successful output of a finished job; returns {'saved': n, 'failed': [...]}
+    job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+    job_prefix = f"{BATCH_PREFIX}{job['jobName']}/"
+    manifest = json.loads(s3.get_object(Bucket=ARTIFACTS_BUCKET_NAME,
+                                        Key=f"{job_prefix}manifest.json")['Body'].read())
+    subject = manifest['subject']
+    report = {'saved': 0, 'failed': []}
+    for key in iter_keys(s3, ARTIFACTS_BUCKET_NAME, f"{job_prefix}output/"):
+        if not key.endswith('.jsonl.out'):
+            continue
+        lines = s3.get_object(Bucket=ARTIFACTS_BUCKET_NAME, Key=key)['Body'].read().decode('utf-8').splitlines()
+        for line in filter(None, lines):
+            output = json.loads(line)
+            kind_name, *item = manifest['records'].get(output.get('recordId'), [None])
+            kind = kinds.get(kind_name)
+            if kind is None:
+                continue
+            try:
+                if 'modelOutput' not in output:
+                    raise RuntimeError(output.get('error', {}).get('errorMessage', 'no output'))
+                if not kind.save(subject, *item, response_text(output['modelOutput'])):
+                    raise RuntimeError("could not be saved")
+                report['saved'] += 1
+            except Exception as e:
+                report['failed'].append((kind_name, item, str(e)))
+    logger.info(f"Collected batch job {job['jobName']}: {report['saved']} saved, {len(report['failed'])} failed")
+    return report
+
+
+def generate_online(subject, records, manifest, kinds, model_id=None):
+    # Small runs: the same records through the regular invocation path
+    report = {'saved': 0, 'failed': []}
+
+    def work(record):
+        kind_name, *item = manifest[record['recordId']]
+        body = record['modelInput']
+        text = invoke_text(body['messages'][0]['content'], body['max_tokens'], model_id=model_id)
+        if not kinds[kind_name].save(subject, *item, text):
+            raise RuntimeError("could not be saved")
+
+    with ThreadPoolExecutor(max_workers=BATCH_PROMPT_WORKERS) as executor:
+        futures = {executor.submit(work, record): record['recordId'] for record in records}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                report['saved'] += 1
+            except Exception as e:
+                kind_name, *item = manifest[futures[future]]
+                report['failed'].append((kind_name, item, str(e)))
+    return report
+
+
+def run(subject, kinds, model_id=None):
+    # End to end: pending items -> prompts -> batch job (or online calls) -> saved artifacts
+    records, manifest = build_records(subject, kinds.values())
+    if not records:
+        logger.info(f"Nothing to generate for '{subject}'")
+        return {'saved': 0, 'failed': []}
+    if len(records) < BATCH_MIN_RECORDS:
+        logger.info(f"{len(records)} records is below the batch minimum; generating online")
+        return generate_online(subject, records, manifest, kinds, model_id)
+    job_arn = submit(subject, records, manifest, model_id)
+    wait(job_arn)
+    return collect(job_arn, kinds)
+
+
+def _usage_error(message):
+    print(f"{message}\n{USAGE}", file=sys.stderr)
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--collect"]:
+        if len(args) != 2:
+            _usage_error("--collect needs the ARN of a batch job")
+        report = collect(args[1], default_kinds())
+    else:
+        kind_names = None
+        if "--kinds" in args:
+            index = args.index("--kinds")
+            if index + 1 >= len(args):
+                _usage_error("--kinds needs a comma-separated list of kinds")
+            kind_names = args[index + 1].split(',')
+            del args[index:index + 2]
+        if len(args) != 1 or args[0].startswith('--'):
+            _usage_error("Give exactly one SUBJECT")
+        kinds = default_kinds()
+        unknown = [name for name in kind_names or [] if name not in kinds]
+        if unknown:
+            _usage_error(f"Unknown kinds: {', '.join(unknown)}")
+        if kind_names:
+            kinds = {name: kinds[name] for name in kind_names}
+        report = run(args[0], kinds)
+    print(f"{report['saved']} saved, {len(report['failed'])} failed")
+    for failure in report['failed']:
+        print(f"  {failure}")
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from aws_clients import get_client
+import llm_cache
+import usage_metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Single entry point for Bedrock model invocations. Every call goes through a per-model
+# AIMD concurrency limiter (halved on throttling, grown by one slot per window of
+# successful calls) and is retried with jittered exponential backoff on throttling and
+# transient errors. Text models share one messages-style request/response schema.
+# Responses are cached by request fingerprint; fresh=True skips the cached answer.
+# stream_text yields the reply as it is generated, for progressive rendering.
+# Every call, cached or not, is recorded in the usage log with its tokens and timing,
+# including calls that fail after all retries and streams abandoned part way.
+CLAUDE_3_SONNET = "anthropic.claude-3-sonnet-20240229-v1:0"
+CLAUDE_V2 = "anthropic.claude-v2"
+STABLE_DIFFUSION_XL = "stability.stable-diffusion-xl-v1"
+
+DEFAULT_TEXT_MODEL = os.getenv('BEDROCK_TEXT_MODEL_ID', CLAUDE_3_SONNET)
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+
+# Read timeout in seconds per model; long generations need more than the default
+MODEL_TIMEOUTS = {
+    CLAUDE_3_SONNET: 180,
+    CLAUDE_V2: 180,
+    STABLE_DIFFUSION_XL: 90,
+}
+DEFAULT_MODEL_TIMEOUT = 120
+
+BEDROCK_MAX_ATTEMPTS = int(os.getenv('BEDROCK_MAX_ATTEMPTS', '6'))
+BEDROCK_BACKOFF_MAX_SECONDS = float(os.getenv('BEDROCK_BACKOFF_MAX_SECONDS', '30'))
+# Upper bound of in-flight calls per model; the limiter adapts below it
+BEDROCK_MAX_CONCURRENCY = int(os.getenv('BEDROCK_MAX_CONCURRENCY', '8'))
+
+THROTTLING_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+TRANSIENT_CODES = ('ServiceUnavailableException', 'InternalServerException', 'ModelNotReadyException',
+                   'ModelTimeoutException')
+
+
+class ConcurrencyLimiter:
+    # Additive-increase / multiplicative-decrease limit on concurrent calls
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= max(1, int(self.limit)):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter(model_id):
+    with _limiters_lock:
+        limiter = _limiters.get(model_id)
+        if limiter is None:
+            limiter = _limiters[model_id] = ConcurrencyLimiter(BEDROCK_MAX_CONCURRENCY)
+        return limiter
+
+
+def _client(model_id):
+    # Retries are handled here, so the client itself makes a single attempt
+    return get_client('bedrock-runtime',
+                      read_timeout=MODEL_TIMEOUTS.get(model_id, DEFAULT_MODEL_TIMEOUT),
+                      retries={'mode': 'standard', 'max_attempts': 1})
+
+
+def _error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def _error_name(error):
+    return _error_code(error) or type(error).__name__
+
+
+def _is_throttling(error):
+    return _error_code(error) in THROTTLING_CODES
+
+
+def _is_retryable(error):
+    if _error_code(error) in THROTTLING_CODES + TRANSIENT_CODES:
+        return True
+    # Read timeouts and dropped connections raised by botocore
+    return type(error).__name__ in ('ReadTimeoutError', 'ConnectTimeoutError', 'EndpointConnectionError',
+                                    'ConnectionClosedError')
+
+
+def _log_retry(retry_state):
+    logger.warning(f"Bedrock call failed ({retry_state.outcome.exception()}); "
+                   f"retrying, attempt {retry_state.attempt_number + 1} of {BEDROCK_MAX_ATTEMPTS}")
+
+
+def invoke_raw(model_id, body, accept="application/json", fresh=False):
+    # Invokes any model with a model-specific request body; returns the raw response bytes
+    started = time.monotonic()
+    cache_key = llm_cache.fingerprint(model_id, body, accept)
+    if not fresh:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            usage_metrics.record(model_id, time.monotonic() - started, cached=True)
+            return cached
+    retrying = _retrying()
+    try:
+        response_bytes, headers = _invoke_with_retries(model_id, body, accept, retrying)
+    except Exception as e:
+        usage_metrics.record(model_id, time.monotonic() - started, retries=_retries(retrying), error=_error_name(e))
+        raise
+    input_tokens, output_tokens = _token_counts(response_bytes, headers)
+    usage_metrics.record(model_id, time.monotonic() - started, input_tokens, output_tokens,
+                         retries=_retries(retrying))
+    llm_cache.put(cache_key, response_bytes)
+    return response_bytes
+
+
+def _token_counts(response_bytes, headers):
+    # Bedrock reports token counts in response headers; messages bodies also carry usage
+    input_tokens = headers.get('x-amzn-bedrock-input-token-count')
+    output_tokens = headers.get('x-amzn-bedrock-output-token-count')
+    if input_tokens is None:
+        try:
+            usage = json.loads(response_bytes).get('usage', {})
+        except (ValueError, AttributeError):
+            usage = {}
+        input_tokens, output_tokens = usage.get('input_tokens'), usage.get('output_tokens')
+    return (int(input_tokens) if input_tokens is not None else None,
+            int(output_tokens) if output_tokens is not None else None)
+
+
+def _retrying():
+    return Retrying(retry=retry_if_exception(_is_retryable),
+                    wait=wait_random_exponential(multiplier=1, max=BEDROCK_BACKOFF_MAX_SECONDS),
+                    stop=stop_after_attempt(BEDROCK_MAX_ATTEMPTS),
+                    before_sleep=_log_retry,
+                    reraise=True)
+
+
+def _retries(retrying):
+    # Attempts beyond the first, counted by the Retrying object as the call ran
+    return max(0, retrying.statistics.get('attempt_number', 1) - 1)
+
+
+def _invoke_with_retries(model_id, body, accept, retrying):
+    limiter = _limiter(model_id)
+    for attempt in retrying:
+        with attempt:
+            limiter.acquire()
+            throttled = False
+            try:
+                response = _client(model_id).invoke_model(modelId=model_id,
+                                                          contentType="application/json",
+                                                          accept=accept,
+                                                          body=json.dumps(body))
+                headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+                return response['body'].read(), headers
+            except Exception as e:
+                throttled = _is_throttling(e)
+                raise
+            finally:
+                limiter.release(throttled)
+
+
+def messages_body(prompt, max_tokens, temperature=0.3, top_p=1.0, system=None, stop_sequences=None, prefill=None):
+    # Request body in the messages schema shared by all Anthropic models on Bedrock.
+    # A prefill is sent as the start of the assistant's turn; the reply continues after it.
+    body = {
+        "anthropic_version": ANTHROPIC_VERSION,
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "top_p": top_p,
+    }
+    if system:
+        body["system"] = system
+    if stop_sequences:
+        body["stop_sequences"] = stop_sequences
+    if prefill:
+        body["messages"].append({"role": "assistant", "content": prefill})
+    return body
+
+
+def response_text(response_body):
+    return "".join(block.get("text", "") for block in response_body.get("content", [])).strip()
+
+
+def invoke_text(prompt, max_tokens, model_id=None, temperature=0.3, top_p=1.0, system=None, stop_sequences=None,
+                fresh=False, prefill=None):
+    # Sends one user message and returns the model's text reply
+    model_id = model_id or DEFAULT_TEXT_MODEL
+    body = messages_body(prompt, max_tokens, temperature, top_p, system, stop_sequences, prefill)
+    return response_text(json.loads(invoke_raw(model_id, body, fresh=fresh)))
+
+
+def _open_stream(model_id, body, limiter, retrying):
+    # Starting the stream is retried like any call; a failure after the first token is not
+    for attempt in retrying:
+        with attempt:
+            limiter.acquire()
+            try:
+                response = _client(model_id).invoke_model_with_response_stream(modelId=model_id,
+                                                                                contentType="application/json",
+                                                                                accept="application/json",
+                                                                                body=json.dumps(body))
+            except Exception as e:
+                limiter.release(_is_throttling(e))
+                raise
+            return response['body']
+
+
+def stream_text(prompt, max_tokens, model_id=None, temperature=0.3, top_p=1.0, system=None, stop_sequences=None,
+                fresh=False, prefill=None):
+    # Generator form of invoke_text: yields text chunks as the model produces them.
+    # A cached reply is yielded in one piece; a completed stream is cached for invoke_text too.
+    model_id = model_id or DEFAULT_TEXT_MODEL
+    body = messages_body(prompt, max_tokens, temperature, top_p, system, stop_sequences, prefill)
+    # The generator body runs later, inside st.write_stream, so the caller is resolved now
+    return _stream(model_id, body, fresh, usage_metrics.find_caller())
+
+
+def _stream(model_id, body, fresh, caller):
+    started = time.monotonic()
+    cache_key = llm_cache.fingerprint(model_id, body)
+    if not fresh:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            usage_metrics.record(model_id, time.monotonic() - started, cached=True, streamed=True, caller=caller)
+            yield response_text(json.loads(cached))
+            return
+
+    limiter = _limiter(model_id)
+    retrying = _retrying()
+    try:
+        events = _open_stream(model_id, body, limiter, retrying)
+    except Exception as e:
+        usage_metrics.record(model_id, time.monotonic() - started, retries=_retries(retrying), streamed=True,
+                             caller=caller, error=_error_name(e))
+        raise
+    parts = []
+    stop_reason = None
+    usage = {}
+    throttled = False
+    error = None
+    aborted = False
+    try:
+        for event in events:
+            if 'chunk' not in event:
+                continue
+            payload = json.loads(event['chunk']['bytes'])
+            if payload.get('type') == 'content_block_delta' and payload['delta'].get('type') == 'text_delta':
+                parts.append(payload['delta']['text'])
+                yield payload['delta']['text']
+            elif payload.get('type') == 'message_start':
+                usage.update(payload['message'].get('usage', {}))
+            elif payload.get('type') == 'message_delta':
+                stop_reason = payload['delta'].get('stop_reason')
+                usage.update(payload.get('usage', {}))
+    except GeneratorExit:
+        # The consumer stopped reading, e.g. the user left the page mid-stream
+        aborted = True
+        events.close()
+        raise
+    except Exception as e:
+        throttled = _is_throttling(e)
+        error = _error_name(e)
+        raise
+    finally:
+        limiter.release(throttled)
+        usage_metrics.record(model_id, time.monotonic() - started, usage.get('input_tokens'),
+                             usage.get('output_tokens'), retries=_retries(retrying), streamed=True, caller=caller,
+                             error=error, aborted=aborted)
+    response_body = {"type": "message", "role": "assistant", "stop_reason": stop_reason,
+                     "content": [{"type": "text", "text": "".join(parts)}], "usage": usage}
+    llm_cache.put(cache_key, json.dumps(response_body).encode('utf-8'))
@@ -0,0 +1,199 @@
+from aws_clients import lazy_client
+import os
+import sys
+import threading
+import time
+import logging
+from dotenv import load_dotenv
+from s3_listing import iter_objects
+from metadata_store import RECORDS_FOLDER
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+# Initialize AWS clients
+s3 = lazy_client('s3')
+# S3 bucket name
+BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
+# Full re-listing interval; changes made through the app are applied incrementally in between
+INDEX_REFRESH_SECONDS = int(os.getenv('BUCKET_INDEX_REFRESH_SECONDS', '300'))
+
+METADATA_SUFFIX = '.metadata.json'
+
+
+# In-memory tree of Bucket1: subject -> chapter -> file.
+# Slotted records and interned names keep a 100k-object bucket small.
+class FileEntry:
+    __slots__ = ('name', 'size', 'etag', 'has_metadata')
+
+    def __init__(self, name, size, etag):
+        self.name = name
+        self.size = size
+        self.etag = etag
+        self.has_metadata = False
+
+
+class ChapterNode:
+    __slots__ = ('files', 'sidecars')
+
+    def __init__(self):
+        # Relative key inside the chapter -> FileEntry
+        self.files = {}
+        # Sidecars seen while listing, linked to their files by link_sidecars()
+        self.sidecars = set()
+
+    def link_sidecars(self):
+        for path in self.sidecars:
+            entry = self.files.get(path)
+            if entry is not None:
+                entry.has_metadata = True
+        self.sidecars = None
+
+
+class SubjectNode:
+    __slots__ = ('chapters', 'own_keys')
+
+    def __init__(self):
+        self.chapters = {}
+        # Objects that belong to the subject itself (folder marker, subject metadata)
+        self.own_keys = 0
+
+
+def _add_object(tree, key, size, etag):
+    parts = key.split('/')
+    if len(parts) < 2:
+        # Top-level objects are not subjects
+        return
+    subject = sys.intern(parts[0])
+    subject_node = tree.get(subject)
+    if subject_node is None:
+        subject_node = tree[subject] = SubjectNode()
+    if len(parts) == 2 or parts[1] == RECORDS_FOLDER:
+        subject_node.own_keys += 1
+        return
+    chapter = sys.intern(parts[1])
+    chapter_node = subject_node.chapters.get(chapter)
+    if chapter_node is None:
+        chapter_node = subject_node.chapters[chapter] = ChapterNode()
+    path = '/'.join(parts[2:])
+    name = parts[-1]
+    if not name:
+        # Folder marker
+        return
+    if name.endswith(METADATA_SUFFIX):
+        chapter_node.sidecars.add(path[:-len(METADATA_SUFFIX)])
+    else:
+        chapter_node.files[path] = FileEntry(name, size, etag.strip('"'))
+
+
+def _list_tree(prefix=''):
+    tree = {}
+    for obj in iter_objects(s3, BUCKET_NAME, prefix):
+        _add_object(tree, obj['Key'], obj['Size'], obj['ETag'])
+    for subject_node in tree.values():
+        for chapter_node in subject_node.chapters.values():
+            chapter_node.link_sidecars()
+    return tree
+
+
+class BucketIndex:
+    def __init__(self):
+        self.tree = {}
+        self.built_at = None
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def mark_dirty(self, subject=None, chapter=None):
+        with self._dirty_lock:
+            if subject is None:
+                self.built_at = None
+            else:
+                self._dirty.add((subject, chapter))
+
+    def refresh(self):
+        with self._refresh_lock:
+            if self.built_at is None or time.monotonic() - self.built_at > INDEX_REFRESH_SECONDS:
+                with self._dirty_lock:
+                    self._dirty.clear()
+                started = time.monotonic()
+                self.tree = _list_tree()
+                self.built_at = time.monotonic()
+                logger.info(f"Bucket index built: {len(self.tree)} subjects in {self.built_at - started:.2f}s")
+                return
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+            # A whole-subject refresh covers its chapters
+            subjects = {subject for subject, chapter in dirty if chapter is None}
+            for subject in subjects:
+                self._refresh_subject(subject)
+            for subject, chapter in dirty:
+                if chapter is not None and subject not in subjects:
+                    self._refresh_chapter(subject, chapter)
+
+    # Readers iterate the tree without a lock, so refreshes never mutate a published dict:
+    # they build a changed copy and swap it in with one assignment.
+    def _refresh_subject(self, subject):
+        subject_node = _list_tree(f"{subject}/").get(subject)
+        tree = dict(self.tree)
+        if subject_node is None:
+            tree.pop(subject, None)
+        else:
+            tree[sys.intern(subject)] = subject_node
+        self.tree = tree
+
+    def _refresh_chapter(self, subject, chapter):
+        chapter_node = _list_tree(f"{subject}/{chapter}/").get(subject, SubjectNode()).chapters.get(chapter)
+        current = self.tree.get(subject)
+        if chapter_node is None and current is None:
+            return
+        subject_node = SubjectNode()
+        if current is not None:
+            subject_node.chapters = dict(current.chapters)
+            subject_node.own_keys = current.own_keys
+        if chapter_node is not None:
+            subject_node.chapters[sys.intern(chapter)] = chapter_node
+        else:
+            subject_node.chapters.pop(chapter, None)
+        tree = dict(self.tree)
+        if subject_node.chapters or subject_node.own_keys:
+            tree[sys.intern(subject)] = subject_node
+        else:
+            tree.pop(subject, None)
+        self.tree = tree
+
+    def subjects(self):
+        self.refresh()
+        return sorted(self.tree)
+
+    def chapters(self, subject):
+        self.refresh()
+        subject_node = self.tree.get(subject)
+        return sorted(subject_node.chapters) if subject_node else []
+
+    def files(self, subject, chapter):
+        self.refresh()
+        subject_node = self.tree.get(subject)
+        chapter_node = subject_node.chapters.get(chapter) if subject_node else None
+        if chapter_node is None:
+            return []
+        return [chapter_node.files[path] for path in sorted(chapter_node.files)]
+
+
+_index = BucketIndex()
+
+
+def list_subjects():
+    return _index.subjects()
+
+
+def list_chapters(subject):
+    return _index.chapters(subject)
+
+
+def list_files(subject, chapter):
+    return _index.files(subject, chapter)
+
+
+def mark_dirty(subject=None, chapter=None):
+    _index.mark_dirty(subject, chapter)
@@ -0,0 +1,59 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from s3_listing import iter_keys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# delete_objects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+DELETE_MAX_WORKERS = int(os.getenv('DELETE_MAX_WORKERS', '8'))
+
+
+def _delete_batch(s3, bucket, keys):
+    try:
+        response = s3.delete_objects(Bucket=bucket,
+                                     Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+    except Exception as e:
+        logger.error(f"Batch delete of {len(keys)} keys in {bucket} failed: {str(e)}")
+        return len(keys), [{'Bucket': bucket, 'Key': key, 'Error': str(e)} for key in keys]
+    # Quiet mode only reports the keys that could not be deleted
+    failures = [{'Bucket': bucket, 'Key': error['Key'], 'Error': f"{error.get('Code')}: {error.get('Message')}"}
+                for error in response.get('Errors', [])]
+    return len(keys), failures
+
+
+def delete_prefixes(s3, targets, max_workers=DELETE_MAX_WORKERS):
+    # targets: iterable of (bucket, prefix). Keys are listed page by page and sent in
+    # batches of 1000 while listing continues; at most 2 * max_workers batches are in flight.
+    report = {'requested': 0, 'deleted': 0, 'failed': []}
+
+    def collect(done):
+        for future in done:
+            count, failures = future.result()
+            report['requested'] += count
+            report['deleted'] += count - len(failures)
+            report['failed'].extend(failures)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for bucket, prefix in targets:
+            if not bucket:
+                continue
+            batch = []
+            for key in iter_keys(s3, bucket, prefix):
+                batch.append(key)
+                if len(batch) == DELETE_BATCH_SIZE:
+                    pending.add(executor.submit(_delete_batch, s3, bucket, batch))
+                    batch = []
+                    if len(pending) >= 2 * max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            if batch:
+                pending.add(executor.submit(_delete_batch, s3, bucket, batch))
+        done, _ = wait(pending)
+        collect(done)
+
+    logger.info(f"Deleted {report['deleted']} of {report['requested']} objects, {len(report['failed'])} failed")
+    return report
@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from topic_index import get_topics
+from artifact_index import get_artifact_status
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Background "generate all missing" jobs for per-topic artifacts (summaries, elaborations).
+# The tools pass in their own generate/save functions, so this module does not import
+# them. Jobs run in process threads and outlive the browser session that started them;
+# each result is saved as soon as it is ready, so restarting a job after a crash only
+# generates what is still missing in the artifacts bucket.
+BULK_MAX_WORKERS = int(os.getenv('BULK_MAX_WORKERS', '4'))
+
+_jobs = {}
+_lock = threading.Lock()
+
+
+class BulkJob:
+    __slots__ = ('key', 'total', 'completed', 'failed', 'cancelled', 'started_at', 'finished_at')
+
+    def __init__(self, key, total):
+        self.key = key
+        self.total = total
+        self.completed = 0
+        # [(chapter, topic, error)]
+        self.failed = []
+        self.cancelled = False
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def running(self):
+        return self.finished_at is None
+
+
+def missing_topics(subject, chapters, artifact_name):
+    # [(chapter, topic)] whose artifact (e.g. 'summary.txt') is not in the artifacts bucket yet
+    missing = []
+    for chapter in chapters:
+        artifacts = get_artifact_status(subject, chapter)
+        missing += [(chapter, topic) for topic in get_topics(subject, chapter)
+                    if artifact_name not in artifacts.get(topic, {})]
+    return missing
+
+
+def _run(job, subject, items, generate, save, max_workers):
+    def work(chapter, topic):
+        if job.cancelled:
+            return False
+        text = generate(subject, chapter, topic)
+        if not save(subject, chapter, topic, text):
+            raise RuntimeError("could not be saved")
+        return True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(work, chapter, topic): (chapter, topic) for chapter, topic in items}
+        for future in as_completed(futures):
+            chapter, topic = futures[future]
+            try:
+                if future.result():
+                    with _lock:
+                        job.completed += 1
+            except Exception as e:
+                logger.error(f"Bulk generation of '{subject}/{chapter}/{topic}' failed: {str(e)}")
+                with _lock:
+                    job.failed.append((chapter, topic, str(e)))
+    with _lock:
+        job.finished_at = time.time()
+    logger.info(f"Bulk job {job.key} finished: {job.completed} generated, {len(job.failed)} failed")
+
+
+def start(key, subject, items, generate, save, max_workers=None):
+    # Starts a job over [(chapter, topic)] unless one with the same key is still running
+    with _lock:
+        job = _jobs.get(key)
+        if job and job.running:
+            return job
+        job = _jobs[key] = BulkJob(key, len(items))
+    threading.Thread(target=_run, args=(job, subject, items, generate, save, max_workers or BULK_MAX_WORKERS),
+                     name=f"bulk-{key}", daemon=True).start()
+    return job
+
+
+def get_job(key):
+    with _lock:
+        return _jobs.get(key)
+
+
+def cancel(key):
+    # Topics already being generated finish and are saved; queued ones are skipped
+    with _lock:
+        job = _jobs.get(key)
+        if job and job.running:
+            job.cancelled = True
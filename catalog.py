@@ -0,0 +1,16 @@
+import bucket_index
+
+# Process-wide catalog of Bucket1 (subjects, chapters, files), shared by every Streamlit
+# session served by this process. Listings are answered from the in-memory bucket index,
+# which is the only cache: writes made through the app are visible on the next read and
+# changes made outside it within BUCKET_INDEX_REFRESH_SECONDS.
+
+
+def cached(key, loader):
+    # Keys are tuples: ('subjects',), ('chapters', subject), ('files', subject, chapter)
+    return list(loader())
+
+
+def invalidate(subject=None, chapter=None):
+    # Re-lists the changed subject/chapter on the next read
+    bucket_index.mark_dirty(subject, chapter)
@@ -1,59 +1,48 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
 import os
 from dotenv import load_dotenv
 import json
 from uuid import uuid4
+import catalog
+import ingestion
+import bucket_index
+import metadata_store
+import topic_index
+from bulk_delete import delete_prefixes
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
-bedrock_agent = boto3.client('bedrock-agent',
-                             aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                             aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                             region_name=os.getenv('AWS_REGION')
-                             )
+s3 = lazy_client('s3')
 # S3 bucket name
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
-# Bedrock Knowledge Base ID
-KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
-# Bedrock Data Source ID
-DATA_SOURCE_ID = os.getenv('BEDROCK_DATA_SOURCE_ID')
+ARTIFACTS_BUCKET_NAME = os.getenv('S3_ARTIFACTS_BUCKET_NAME')
 
 
 
 def get_chapters(subject):
-    response = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=f"{subject}/", Delimiter='/')
-    return [prefix['Prefix'].split('/')[-2] for prefix in response.get('CommonPrefixes', [])]
+    return catalog.cached(('chapters', subject), lambda: bucket_index.list_chapters(subject))
 
 
 
 def create_chapter(subject_name, chapter_name):
     s3.put_object(Bucket=BUCKET_NAME, Key=f"{subject_name}/{chapter_name}/")
+    catalog.invalidate(subject_name, chapter_name)
     st.success(f"Chapter '{chapter_name}' created successfully in subject '{subject_name}'.")
     st.rerun()
 
 def delete_chapter(subject_name, chapter_name):
-    # List all objects in the chapter folder
-    objects_to_delete = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=f"{subject_name}/{chapter_name}/")
-    # Delete all objects in the chapter folder
-    for obj in objects_to_delete.get('Contents', []):
-        s3.delete_object(Bucket=BUCKET_NAME, Key=obj['Key'])
-    # Delete the chapter folder itself
-    s3.delete_object(Bucket=BUCKET_NAME, Key=f"{subject_name}/{chapter_name}/")
-    st.success(f"Chapter '{chapter_name}' and all its contents deleted successfully from subject '{subject_name}'.")
-    # Trigger a sync after deletion
-    sync_knowledge_base()
-
-
-def sync_knowledge_base():
-    try:
-        response = bedrock_agent.start_ingestion_job(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            dataSourceId=DATA_SOURCE_ID
-        )
-        st.info(f"Knowledge Base sync started. Job ID: {response['ingestionJob']['ingestionJobId']}")
-    except Exception as e:
-        st.error(f"Failed to start Knowledge Base sync: {str(e)}")
+    # Delete the chapter folder and its generated artifacts (summaries, elaborations, DeliveredLectures)
+    metadata_store.ensure_migrated(subject_name)
+    report = delete_prefixes(s3, [(BUCKET_NAME, f"{subject_name}/{chapter_name}/"),
+                                  (BUCKET_NAME, metadata_store.chapter_records_prefix(subject_name, chapter_name)),
+                                  (ARTIFACTS_BUCKET_NAME, f"{subject_name}/{chapter_name}/")])
+    metadata_store.compact_subject_index(subject_name)
+    topic_index.invalidate(subject_name, chapter_name)
+    catalog.invalidate(subject_name, chapter_name)
+    st.session_state.deletion_failures = report['failed']
+    if report['failed']:
+        st.error(f"{len(report['failed'])} objects of chapter '{chapter_name}' could not be deleted.")
+    else:
+        st.success(f"Chapter '{chapter_name}' and all its contents deleted successfully from subject '{subject_name}'.")
+    # Schedule a sync after deletion
+    ingestion.request_sync(f"Deleted chapter '{subject_name}/{chapter_name}'")
+
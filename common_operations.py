@@ -1,4 +1,6 @@
 import streamlit as st
+import ingestion
+import bulk_generation
 
 def confirm_delete(item_type, item_name):
     st.warning(f"Are you sure you want to delete the {item_type} '{item_name}'?")
@@ -12,6 +14,93 @@ def confirm_delete(item_type, item_name):
     return False
 
 
+def show_deletion_failures():
+    # Failures from the last subject/chapter deletion survive the rerun that follows it
+    failures = st.session_state.get('deletion_failures')
+    if failures:
+        with st.expander(f"⚠️ {len(failures)} objects could not be deleted"):
+            for failure in failures[:100]:
+                st.write(f"{failure['Bucket']}/{failure['Key']}: {failure['Error']}")
+            if st.button("Dismiss", key="dismiss_deletion_failures"):
+                st.session_state.deletion_failures = None
+                st.rerun()
+
+
+@st.fragment(run_every=5)
+def show_ingestion_status():
+    # Reads the scheduler's in-memory status, so refreshing this fragment costs no AWS calls
+    status = ingestion.get_status()
+    stats = status['statistics']
+    if status['state'] == ingestion.PENDING:
+        st.caption("🕒 Knowledge Base sync scheduled; recent changes will be searchable once it completes.")
+    elif status['state'] == ingestion.RUNNING:
+        st.caption(f"🔄 Knowledge Base sync running (job {status['job_id']}): "
+                   f"{stats.get('numberOfDocumentsScanned', 0)} documents scanned so far.")
+    elif status['state'] == ingestion.COMPLETE:
+        st.caption(f"✅ Knowledge Base up to date: {stats.get('numberOfNewDocumentsIndexed', 0)} new, "
+                   f"{stats.get('numberOfModifiedDocumentsIndexed', 0)} modified, "
+                   f"{stats.get('numberOfDocumentsDeleted', 0)} deleted, "
+                   f"{stats.get('numberOfDocumentsFailed', 0)} failed.")
+    elif status['state'] == ingestion.FAILED:
+        reasons = status['error'] or '; '.join(status['failure_reasons']) or 'unknown error'
+        st.caption(f"⚠️ Knowledge Base sync failed: {reasons}")
+        if st.button("Retry sync", key="retry_ingestion"):
+            ingestion.request_sync("Manual retry")
+
+
+def warn_if_retrieval_stale():
+    # Generation tools retrieve from the Knowledge Base; warn while recent uploads or deletions are not ingested
+    if ingestion.is_stale():
+        st.warning("Reference materials changed recently and the Knowledge Base is still syncing. "
+                   "Generated content may not reflect the latest files yet.")
+
+
+def regenerate_fresh_option(key):
+    # Model responses are cached by prompt; this lets the user ask for a new answer instead
+    return st.checkbox("Regenerate fresh (ignore cached AI responses)", key=key,
+                       help="Unchanged prompts normally reuse the previous AI response.")
+
+
+def show_bulk_generation(tool, artifact_name, subject, chapter, all_chapters, generate, save):
+    # "Generate all missing" for the selected chapter or the whole subject. The job runs in the
+    # background; starting it again after an interruption picks up the topics still missing.
+    with st.expander("⚡ Generate all missing"):
+        scope = st.radio("Scope", ["This chapter", "Whole subject"], key=f"{tool}_bulk_scope", horizontal=True)
+        whole_subject = scope == "Whole subject"
+        key = (tool, subject, None if whole_subject else chapter)
+        job = bulk_generation.get_job(key)
+        if not (job and job.running):
+            if st.button("Generate all missing", key=f"{tool}_bulk_start"):
+                items = bulk_generation.missing_topics(subject, all_chapters if whole_subject else [chapter],
+                                                       artifact_name)
+                if items:
+                    bulk_generation.start(key, subject, items, generate, save)
+                else:
+                    st.info("Every topic already has one.")
+        show_bulk_progress(key)
+
+
+@st.fragment(run_every=2)
+def show_bulk_progress(key):
+    job = bulk_generation.get_job(key)
+    if not job:
+        return
+    done = job.completed + len(job.failed)
+    st.progress(done / job.total if job.total else 1.0,
+                text=f"{job.completed} of {job.total} generated" + (f", {len(job.failed)} failed" if job.failed else ""))
+    for chapter, topic, error in job.failed[:20]:
+        st.caption(f"⚠️ {chapter} / {topic}: {error}")
+    if job.running:
+        if job.cancelled:
+            st.caption("Stopping after the topics in progress...")
+        elif st.button("Stop", key=f"bulk_stop_{key}"):
+            bulk_generation.cancel(key)
+    elif st.session_state.get(f"bulk_seen_{key}") != job.finished_at:
+        # Rerun the whole page once so the topic list shows the new artifacts
+        st.session_state[f"bulk_seen_{key}"] = job.finished_at
+        st.rerun()
+
+
 def create_list_item(name, item_type, on_delete):
     st.markdown(f'<div class="{item_type}-item"><i class="fas fa-{"book" if item_type == "subject" else "file-alt"}"></i>{name}</div>', unsafe_allow_html=True)
     if st.button("🗑️ Delete", key=f"delete_{item_type}_{name}"):
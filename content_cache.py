@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Two-tier cache of S3 object bodies (summaries, elaborations, transcripts, lecture assets)
+# keyed by (bucket, key). Entries are revalidated with If-None-Match, so an unchanged
+# object costs a 304 instead of a download, and are dropped locally on every write.
+s3 = lazy_client('s3')
+
+CONTENT_CACHE_DIR = os.getenv('CONTENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'aiforlecture-content-cache'))
+CONTENT_CACHE_MEMORY_BYTES = int(os.getenv('CONTENT_CACHE_MEMORY_BYTES', str(64 * 1024 * 1024)))
+CONTENT_CACHE_DISK_BYTES = int(os.getenv('CONTENT_CACHE_DISK_BYTES', str(1024 * 1024 * 1024)))
+# Entries checked against S3 within this window are served without any request
+CONTENT_CACHE_REVALIDATE_SECONDS = float(os.getenv('CONTENT_CACHE_REVALIDATE_SECONDS', '30'))
+
+_lock = threading.Lock()
+# (bucket, key) -> (etag, body, validated_at), least recently used first
+_memory = OrderedDict()
+_memory_bytes = 0
+_disk_bytes = None
+
+
+def _path(bucket, key):
+    digest = hashlib.sha256(f"{bucket}/{key}".encode('utf-8')).hexdigest()
+    return os.path.join(CONTENT_CACHE_DIR, digest)
+
+
+def _memory_put(cache_key, etag, body, validated_at):
+    global _memory_bytes
+    previous = _memory.pop(cache_key, None)
+    if previous:
+        _memory_bytes -= len(previous[1])
+    if len(body) > CONTENT_CACHE_MEMORY_BYTES:
+        return
+    _memory[cache_key] = (etag, body, validated_at)
+    _memory_bytes += len(body)
+    while _memory_bytes > CONTENT_CACHE_MEMORY_BYTES:
+        _, (_, evicted, _) = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted)
+
+
+def _disk_usage():
+    global _disk_bytes
+    if _disk_bytes is None:
+        os.makedirs(CONTENT_CACHE_DIR, exist_ok=True)
+        _disk_bytes = sum(entry.stat().st_size for entry in os.scandir(CONTENT_CACHE_DIR)
+                          if entry.name.endswith('.body'))
+    return _disk_bytes
+
+
+def _disk_get(bucket, key):
+    path = _path(bucket, key)
+    try:
+        with open(path + '.json', encoding='utf-8') as meta_file:
+            etag = json.load(meta_file)['etag']
+        with open(path + '.body', 'rb') as body_file:
+            body = body_file.read()
+        # The modification time doubles as the LRU clock for disk eviction
+        os.utime(path + '.body')
+    except (OSError, ValueError, KeyError):
+        return None
+    return etag, body
+
+
+def _disk_put(bucket, key, etag, body):
+    global _disk_bytes
+    if len(body) > CONTENT_CACHE_DISK_BYTES:
+        return
+    _disk_remove(bucket, key)
+    path = _path(bucket, key)
+    try:
+        _disk_usage()
+        with open(path + '.body', 'wb') as body_file:
+            body_file.write(body)
+        with open(path + '.json', 'w', encoding='utf-8') as meta_file:
+            json.dump({'bucket': bucket, 'key': key, 'etag': etag}, meta_file)
+        _disk_bytes += len(body)
+    except OSError as e:
+        logger.error(f"Could not write content cache entry for {key}: {str(e)}")
+        return
+    if _disk_bytes > CONTENT_CACHE_DISK_BYTES:
+        _disk_evict()
+
+
+def _disk_remove(bucket, key):
+    global _disk_bytes
+    path = _path(bucket, key)
+    try:
+        size = os.path.getsize(path + '.body')
+        os.remove(path + '.body')
+        if _disk_bytes is not None:
+            _disk_bytes -= size
+    except OSError:
+        pass
+    try:
+        os.remove(path + '.json')
+    except OSError:
+        pass
+
+
+def _disk_evict():
+    global _disk_bytes
+    entries = sorted((entry for entry in os.scandir(CONTENT_CACHE_DIR) if entry.name.endswith('.body')),
+                     key=lambda entry: entry.stat().st_mtime)
+    for entry in entries:
+        if _disk_bytes <= CONTENT_CACHE_DISK_BYTES:
+            break
+        size = entry.stat().st_size
+        base = entry.path[:-len('.body')]
+        for suffix in ('.body', '.json'):
+            try:
+                os.remove(base + suffix)
+            except OSError:
+                pass
+        _disk_bytes -= size
+
+
+def _is_not_modified(error):
+    return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304 or \
+        error.response.get('Error', {}).get('Code') in ('304', 'NotModified')
+
+
+def get_object_bytes(bucket, key):
+    # Returns the object body, or None if the object does not exist
+    cache_key = (bucket, key)
+    with _lock:
+        cached = _memory.get(cache_key)
+        if cached:
+            _memory.move_to_end(cache_key)
+            if time.monotonic() - cached[2] < CONTENT_CACHE_REVALIDATE_SECONDS:
+                return cached[1]
+        else:
+            cached = _disk_get(bucket, key)
+    try:
+        if cached:
+            response = s3.get_object(Bucket=bucket, Key=key, IfNoneMatch=cached[0])
+        else:
+            response = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        invalidate(bucket, key)
+        return None
+    except s3.exceptions.ClientError as e:
+        if cached and _is_not_modified(e):
+            with _lock:
+                _memory_put(cache_key, cached[0], cached[1], time.monotonic())
+            return cached[1]
+        raise
+    body = response['Body'].read()
+    with _lock:
+        _memory_put(cache_key, response['ETag'], body, time.monotonic())
+        _disk_put(bucket, key, response['ETag'], body)
+    return body
+
+
+def invalidate(bucket, key):
+    global _memory_bytes
+    with _lock:
+        previous = _memory.pop((bucket, key), None)
+        if previous:
+            _memory_bytes -= len(previous[1])
+        _disk_remove(bucket, key)
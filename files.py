@@ -1,93 +1,44 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
 import os
 from dotenv import load_dotenv
-import json
 from uuid import uuid4
 import logging
+import catalog
+import ingestion
+import bucket_index
+import metadata_store
+import topic_index
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
-bedrock_agent = boto3.client('bedrock-agent',
-                             aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                             aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                             region_name=os.getenv('AWS_REGION')
-                             )
+s3 = lazy_client('s3')
 # S3 bucket name
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
-# Bedrock Knowledge Base ID
-KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
-# Bedrock Data Source ID
-DATA_SOURCE_ID = os.getenv('BEDROCK_DATA_SOURCE_ID')
-
-
-def sync_knowledge_base():
-    logger.info(
-        f"Attempting to sync Knowledge Base. Knowledge Base ID: {KNOWLEDGE_BASE_ID}, Data Source ID: {DATA_SOURCE_ID}")
-    try:
-        response = bedrock_agent.start_ingestion_job(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            dataSourceId=DATA_SOURCE_ID
-        )
-        logger.info(f"Knowledge Base sync started successfully. Response: {response}")
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during sync: {str(e)}")
-
 
 
 def get_files(subject, chapter):
-    prefix = f"{subject}/{chapter}/"
-    response = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-    return [obj['Key'].split('/')[-1] for obj in response.get('Contents', [])
-            if obj['Key'] != prefix and not obj['Key'].endswith('.metadata.json')]
+    return catalog.cached(('files', subject, chapter),
+                          lambda: [entry.name for entry in bucket_index.list_files(subject, chapter)])
 
 
 def update_subject_metadata(subject, chapter, filename, action='delete', topics=None):
-    subject_metadata_key = f"{subject}/subject_metadata.json"
+    # Each file has its own metadata record, written with ETag compare-and-swap
     try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=subject_metadata_key)
-        subject_metadata = json.loads(response['Body'].read().decode('utf-8'))
-    except s3.exceptions.NoSuchKey:
-        subject_metadata = {"files": []}
-
-    if action == 'delete':
-        subject_metadata['files'] = [
-            file for file in subject_metadata['files']
-            if not (file['filename'] == filename and file['chapter'] == chapter)
-        ]
-    elif action == 'add':
-        if not any(file['filename'] == filename and file['chapter'] == chapter
-                   for file in subject_metadata['files']):
-            subject_metadata['files'].append({
-                "filename": filename,
-                "chapter": chapter,
-                "topics": []
-            })
-    elif action == 'update':
-        for file in subject_metadata['files']:
-            if file['filename'] == filename and file['chapter'] == chapter:
-                file['topics'] = topics
-                break
-        else:
-            subject_metadata['files'].append({
-                "filename": filename,
-                "chapter": chapter,
-                "topics": topics
-            })
-
-    # Convert the metadata to a JSON string
-    metadata_json = json.dumps(subject_metadata, ensure_ascii=False, indent=2)
-
-    # Upload updated subject metadata
-    s3.put_object(Bucket=BUCKET_NAME, Key=subject_metadata_key, Body=metadata_json, ContentType='application/json')
+        if action == 'delete':
+            metadata_store.delete_file_record(subject, chapter, filename)
+        elif action == 'add':
+            # Keeps the topics of a file that is uploaded again
+            metadata_store.update_file_record(subject, chapter, filename, lambda record: record)
+        elif action == 'update':
+            metadata_store.update_file_record(subject, chapter, filename,
+                                              lambda record: {**record, "topics": topics})
+    finally:
+        # After the write, so a read in between cannot cache the old topics again
+        topic_index.invalidate(subject, chapter)
 
 
 
@@ -98,10 +49,11 @@ def delete_file(subject, chapter, filename):
     # Also delete the metadata file if it exists
     metadata_key = f"{subject}/{chapter}/{filename}.metadata.json"
     s3.delete_object(Bucket=BUCKET_NAME, Key=metadata_key)
+    catalog.invalidate(subject, chapter)
     # Update subject metadata
     update_subject_metadata(subject, chapter, filename, action='delete')
     st.success(f"File '{filename}' deleted successfully.")
-    sync_knowledge_base()
+    ingestion.request_document_changes(deletes=[key], reason=f"Deleted file '{key}'")
 
 
 def display_file_list(subject, chapter, files):
@@ -0,0 +1,53 @@
+import os
+import re
+import subprocess
+import sys
+
+# Import-time report for the app's entry point and each tool module.
+# Every module is imported in a fresh interpreter with `python -X importtime`,
+# so the numbers are cold-start costs. Usage:
+#   python import_benchmark.py [module ...] [--top N]
+
+MODULES = ["main", "manage_subjects", "manage_chapters", "upload_materials", "Topics_Summarizer",
+           "topicSummaryCreator", "Elaborate", "LectureAnalyzer", "lecture_planner", "usage_dashboard"]
+
+LINE_PATTERN = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module_name):
+    # Returns [(cumulative_us, self_us, package, depth)] in the order Python reports them
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, package = match.groups()
+            entries.append((int(cumulative_us), int(self_us), package, (len(indent) - 1) // 2))
+    if result.returncode != 0:
+        print(f"  import {module_name} failed: {result.stderr.strip().splitlines()[-1]}")
+    return entries
+
+
+def report(module_name, top):
+    entries = measure(module_name)
+    if not entries:
+        return
+    total_us = sum(cumulative for cumulative, _, _, depth in entries if depth == 0)
+    print(f"{module_name}: {total_us / 1000:.1f} ms total")
+    # Slowest packages by cumulative time, including everything they import
+    for cumulative, self_us, package, depth in sorted(entries, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {package}")
+    print()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    top = 15
+    if "--top" in args:
+        index = args.index("--top")
+        top = int(args[index + 1])
+        del args[index:index + 2]
+    for module_name in args or MODULES:
+        report(module_name, top)
@@ -0,0 +1,370 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Knowledge Base ingestion scheduler. Mutations call request_document_changes() for
+# individual files or request_sync() for bulk changes; requests arriving close together
+# are coalesced, and at most one ingestion runs per data source at a time. Small
+# batches of changed documents are pushed or removed directly after a short
+# INGESTION_DIRECT_DEBOUNCE_SECONDS; anything larger falls back to a full data-source
+# ingestion job, which waits the longer INGESTION_DEBOUNCE_SECONDS.
+# A background worker runs the ingestion, polls it with backoff and keeps the status
+# the UI reads.
+bedrock_agent = lazy_client('bedrock-agent')
+KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
+DATA_SOURCE_ID = os.getenv('BEDROCK_DATA_SOURCE_ID')
+BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
+
+# Direct ingestion is cheap per document, so new files become searchable almost at once;
+# a full sync re-scans the data source, so its requests are coalesced over a longer window
+INGESTION_DIRECT_DEBOUNCE_SECONDS = float(os.getenv('INGESTION_DIRECT_DEBOUNCE_SECONDS', '2'))
+INGESTION_DEBOUNCE_SECONDS = float(os.getenv('INGESTION_DEBOUNCE_SECONDS', '20'))
+# Above this many changed documents a full ingestion job is cheaper than direct ingestion
+INGESTION_INCREMENTAL_MAX_DOCUMENTS = int(os.getenv('INGESTION_INCREMENTAL_MAX_DOCUMENTS', '100'))
+# Documents per ingest/delete/get request
+INGESTION_DOCUMENT_BATCH_SIZE = 10
+# How long the newest completed job of a data source is reused before it is looked up again
+INGESTION_CHECK_SECONDS = float(os.getenv('INGESTION_CHECK_SECONDS', '10'))
+INGESTION_POLL_MIN_SECONDS = 2.0
+INGESTION_POLL_MAX_SECONDS = 30.0
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+IDLE = 'idle'
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+_ACTIVE_JOB_STATUSES = ('STARTING', 'IN_PROGRESS', 'STOPPING')
+_ACTIVE_DOCUMENT_STATUSES = ('STARTING', 'PENDING', 'IN_PROGRESS', 'DELETING', 'DELETE_IN_PROGRESS')
+_INDEXED_DOCUMENT_STATUSES = ('INDEXED', 'IGNORED')
+_MAX_REASONS = 20
+
+_lock = threading.Lock()
+_states = {}
+# (knowledge base, data source) -> (monotonic time of the lookup, newest COMPLETE job ID)
+_latest_completed = {}
+
+
+class _DataSourceState:
+    __slots__ = ('pending', 'full_sync', 'changes', 'requested_at', 'reasons', 'worker', 'job',
+                 'last_completed', 'error')
+
+    def __init__(self):
+        self.pending = False
+        self.full_sync = False
+        # S3 key -> UPSERT / DELETE; the latest change to a key wins
+        self.changes = {}
+        # Monotonic time of the latest request; ingestion starts once it is this old
+        self.requested_at = None
+        self.reasons = []
+        self.worker = None
+        # Latest ingestion as an ingestion-job description; direct ingestions are
+        # reported in the same shape so the UI does not tell them apart
+        self.job = None
+        self.last_completed = None
+        self.error = None
+
+
+def _state(knowledge_base_id, data_source_id):
+    key = (knowledge_base_id, data_source_id)
+    state = _states.get(key)
+    if state is None:
+        state = _states[key] = _DataSourceState()
+    return state
+
+
+def _schedule(knowledge_base_id, data_source_id, reason, full_sync=False, changes=None):
+    knowledge_base_id = knowledge_base_id or KNOWLEDGE_BASE_ID
+    data_source_id = data_source_id or DATA_SOURCE_ID
+    with _lock:
+        state = _state(knowledge_base_id, data_source_id)
+        state.pending = True
+        state.full_sync = state.full_sync or full_sync
+        state.changes.update(changes or {})
+        state.requested_at = time.monotonic()
+        if reason:
+            state.reasons = (state.reasons + [reason])[-_MAX_REASONS:]
+        if state.worker is None:
+            state.worker = threading.Thread(target=_run, args=(knowledge_base_id, data_source_id, state),
+                                            name=f"ingestion-{data_source_id}", daemon=True)
+            state.worker.start()
+    logger.info(f"Knowledge Base sync requested ({reason or 'unspecified change'})")
+
+
+def request_sync(reason=None, knowledge_base_id=None, data_source_id=None):
+    # Schedules a full ingestion job; repeated calls within the debounce window share one job
+    _schedule(knowledge_base_id, data_source_id, reason, full_sync=True)
+
+
+def request_document_changes(upserts=(), deletes=(), reason=None, knowledge_base_id=None, data_source_id=None):
+    # Schedules direct ingestion of changed files and removal of deleted ones, by S3 key
+    changes = {key: UPSERT for key in upserts}
+    changes.update({key: DELETE for key in deletes})
+    _schedule(knowledge_base_id, data_source_id, reason, changes=changes)
+
+
+def _debounce(state):
+    if state.full_sync or len(state.changes) > INGESTION_INCREMENTAL_MAX_DOCUMENTS:
+        return INGESTION_DEBOUNCE_SECONDS
+    return INGESTION_DIRECT_DEBOUNCE_SECONDS
+
+
+def _run(knowledge_base_id, data_source_id, state):
+    while True:
+        with _lock:
+            if not state.pending:
+                state.worker = None
+                return
+            delay = state.requested_at + _debounce(state) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            continue
+        try:
+            # A job started elsewhere (another app process, the console) must finish first
+            active = _find_active_job(knowledge_base_id, data_source_id)
+            if active:
+                _poll_job(knowledge_base_id, data_source_id, active, state)
+                continue
+            with _lock:
+                reasons, state.reasons = state.reasons, []
+                full_sync, state.full_sync = state.full_sync, False
+                changes, state.changes = state.changes, {}
+                state.pending = False
+            if not full_sync and len(changes) <= INGESTION_INCREMENTAL_MAX_DOCUMENTS:
+                try:
+                    _ingest_documents(knowledge_base_id, data_source_id, changes, reasons, state)
+                    continue
+                except Exception as e:
+                    # E.g. a data source that does not support direct ingestion
+                    logger.error(f"Direct ingestion failed, falling back to a full sync: {str(e)}")
+            job = _start_job(knowledge_base_id, data_source_id, reasons, state)
+            if job:
+                _poll_job(knowledge_base_id, data_source_id, job['ingestionJobId'], state)
+        except Exception as e:
+            logger.error(f"Knowledge Base ingestion failed: {str(e)}")
+            with _lock:
+                state.error = str(e)
+            time.sleep(INGESTION_POLL_MAX_SECONDS)
+
+
+def _error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def _find_active_job(knowledge_base_id, data_source_id):
+    response = bedrock_agent.list_ingestion_jobs(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': list(_ACTIVE_JOB_STATUSES)}],
+        sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+        maxResults=1)
+    jobs = response.get('ingestionJobSummaries', [])
+    return jobs[0]['ingestionJobId'] if jobs else None
+
+
+def _start_job(knowledge_base_id, data_source_id, reasons, state):
+    try:
+        response = bedrock_agent.start_ingestion_job(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            description='; '.join(reasons)[:200] or 'Scheduled sync')
+    except Exception as e:
+        if _error_code(e) != 'ConflictException':
+            raise
+        # Another job just started; retry once it has finished
+        with _lock:
+            state.pending = True
+            state.full_sync = True
+            state.reasons = reasons + state.reasons
+        return None
+    job = response['ingestionJob']
+    logger.info(f"Knowledge Base sync started. Job ID: {job['ingestionJobId']}")
+    with _lock:
+        state.job = job
+        state.error = None
+    return job
+
+
+def _poll_job(knowledge_base_id, data_source_id, job_id, state):
+    delay = INGESTION_POLL_MIN_SECONDS
+    while True:
+        time.sleep(delay)
+        job = bedrock_agent.get_ingestion_job(knowledgeBaseId=knowledge_base_id,
+                                              dataSourceId=data_source_id,
+                                              ingestionJobId=job_id)['ingestionJob']
+        with _lock:
+            state.job = job
+            if job['status'] == 'COMPLETE':
+                state.last_completed = job
+        if job['status'] not in _ACTIVE_JOB_STATUSES:
+            logger.info(f"Knowledge Base sync {job_id} finished with status {job['status']}")
+            return job
+        delay = min(delay * 2, INGESTION_POLL_MAX_SECONDS)
+
+
+def _s3_uri(key):
+    return f"s3://{BUCKET_NAME}/{key}"
+
+
+def _identifier(key):
+    return {'dataSourceType': 'S3', 's3': {'uri': _s3_uri(key)}}
+
+
+def _document(key):
+    # The file and its .metadata.json sidecar, so metadata filters keep working
+    return {
+        'content': {'dataSourceType': 'S3', 's3': {'s3Location': {'uri': _s3_uri(key)}}},
+        'metadata': {'type': 'S3_LOCATION', 's3Location': {'uri': _s3_uri(f"{key}.metadata.json")}},
+    }
+
+
+def _batches(items):
+    for start in range(0, len(items), INGESTION_DOCUMENT_BATCH_SIZE):
+        yield items[start:start + INGESTION_DOCUMENT_BATCH_SIZE]
+
+
+def _ingest_documents(knowledge_base_id, data_source_id, changes, reasons, state):
+    upserts = sorted(key for key, action in changes.items() if action == UPSERT)
+    deletes = sorted(key for key, action in changes.items() if action == DELETE)
+    now = datetime.now(timezone.utc)
+    job = {
+        'ingestionJobId': f"direct-{now.strftime('%Y%m%dT%H%M%S%f')}",
+        'description': '; '.join(reasons)[:200],
+        'status': 'IN_PROGRESS',
+        'startedAt': now,
+        'updatedAt': now,
+        'statistics': {'numberOfDocumentsScanned': len(changes)},
+        'failureReasons': [],
+    }
+    with _lock:
+        state.job = job
+        state.error = None
+    logger.info(f"Ingesting {len(upserts)} documents and removing {len(deletes)} directly")
+    for batch in _batches(upserts):
+        bedrock_agent.ingest_knowledge_base_documents(knowledgeBaseId=knowledge_base_id,
+                                                      dataSourceId=data_source_id,
+                                                      documents=[_document(key) for key in batch])
+    for batch in _batches(deletes):
+        bedrock_agent.delete_knowledge_base_documents(knowledgeBaseId=knowledge_base_id,
+                                                      dataSourceId=data_source_id,
+                                                      documentIdentifiers=[_identifier(key) for key in batch])
+    details = _poll_documents(knowledge_base_id, data_source_id, upserts + deletes)
+
+    indexed = [key for key in upserts if details.get(key, {}).get('status') in _INDEXED_DOCUMENT_STATUSES]
+    deleted = [key for key in deletes if details.get(key, {}).get('status') in (None, 'NOT_FOUND')]
+    failed = [key for key in upserts + deletes if key not in indexed and key not in deleted]
+    job = {**job,
+           'status': 'FAILED' if failed else 'COMPLETE',
+           'updatedAt': datetime.now(timezone.utc),
+           'statistics': {'numberOfDocumentsScanned': len(changes),
+                          'numberOfModifiedDocumentsIndexed': len(indexed),
+                          'numberOfDocumentsDeleted': len(deleted),
+                          'numberOfDocumentsFailed': len(failed)},
+           'failureReasons': [f"{key}: {details.get(key, {}).get('statusReason') or details.get(key, {}).get('status')}"
+                              for key in failed][:20]}
+    with _lock:
+        state.job = job
+        if not failed:
+            state.last_completed = job
+    logger.info(f"Direct ingestion {job['ingestionJobId']} finished with status {job['status']}")
+    return job
+
+
+def _poll_documents(knowledge_base_id, data_source_id, keys):
+    # Returns S3 key -> document detail once no document is still being processed
+    details = {}
+    remaining = list(keys)
+    delay = INGESTION_POLL_MIN_SECONDS
+    while remaining:
+        time.sleep(delay)
+        for batch in _batches(remaining):
+            try:
+                response = bedrock_agent.get_knowledge_base_documents(
+                    knowledgeBaseId=knowledge_base_id,
+                    dataSourceId=data_source_id,
+                    documentIdentifiers=[_identifier(key) for key in batch])
+            except Exception as e:
+                if _error_code(e) != 'ResourceNotFoundException':
+                    raise
+                # Deleted documents are no longer known to the knowledge base
+                details.update({key: {'status': 'NOT_FOUND'} for key in batch})
+                continue
+            for detail in response.get('documentDetails', []):
+                uri = detail['identifier']['s3']['uri']
+                details[uri[len(_s3_uri('')):]] = detail
+        remaining = [key for key in remaining if details.get(key, {}).get('status') in _ACTIVE_DOCUMENT_STATUSES]
+        delay = min(delay * 2, INGESTION_POLL_MAX_SECONDS)
+    return details
+
+
+def get_status(knowledge_base_id=None, data_source_id=None):
+    # Returns {'state', 'job_id', 'statistics', 'failure_reasons', 'error', 'last_completed_job_id', ...}
+    knowledge_base_id = knowledge_base_id or KNOWLEDGE_BASE_ID
+    data_source_id = data_source_id or DATA_SOURCE_ID
+    with _lock:
+        state = _state(knowledge_base_id, data_source_id)
+        job = state.job
+        if job and job['status'] in _ACTIVE_JOB_STATUSES:
+            phase = RUNNING
+        elif state.pending:
+            phase = PENDING
+        elif state.error or (job and job['status'] != 'COMPLETE'):
+            phase = FAILED
+        elif job:
+            phase = COMPLETE
+        else:
+            phase = IDLE
+        return {
+            'state': phase,
+            'pending_changes': state.pending,
+            'job_id': job['ingestionJobId'] if job else None,
+            'started_at': job.get('startedAt') if job else None,
+            'updated_at': job.get('updatedAt') if job else None,
+            'statistics': dict(job.get('statistics', {})) if job else {},
+            'failure_reasons': list(job.get('failureReasons', [])) if job else [],
+            'error': state.error,
+            'last_completed_job_id': state.last_completed['ingestionJobId'] if state.last_completed else None,
+        }
+
+
+def latest_completed_job_id(knowledge_base_id=None, data_source_id=None):
+    # Newest COMPLETE ingestion job of the data source, whichever process or console started it.
+    # Looked up at most every INGESTION_CHECK_SECONDS; a failed lookup keeps the previous answer.
+    knowledge_base_id = knowledge_base_id or KNOWLEDGE_BASE_ID
+    data_source_id = data_source_id or DATA_SOURCE_ID
+    key = (knowledge_base_id, data_source_id)
+    with _lock:
+        checked = _latest_completed.get(key)
+    if checked and time.monotonic() - checked[0] < INGESTION_CHECK_SECONDS:
+        return checked[1]
+    try:
+        response = bedrock_agent.list_ingestion_jobs(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': ['COMPLETE']}],
+            sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+            maxResults=1)
+        jobs = response.get('ingestionJobSummaries', [])
+        job_id = jobs[0]['ingestionJobId'] if jobs else None
+    except Exception as e:
+        logger.error(f"Error listing Knowledge Base ingestion jobs: {str(e)}")
+        job_id = checked[1] if checked else None
+    with _lock:
+        _latest_completed[key] = (time.monotonic(), job_id)
+    return job_id
+
+
+def is_stale(knowledge_base_id=None, data_source_id=None):
+    # True while changes made in this process have not been ingested yet
+    return get_status(knowledge_base_id, data_source_id)['state'] in (PENDING, RUNNING)
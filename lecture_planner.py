@@ -1,75 +1,48 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
+from bedrock_invoke import invoke_text, invoke_raw, STABLE_DIFFUSION_XL
+from retrieval import retrieve, build_context
 import os
 import json
 from dotenv import load_dotenv
 from subjects import get_subjects
 from chapters import get_chapters
-from topicSummaryCreator import get_topics
-from pptx import Presentation
-from pptx.util import Inches, Pt
+from topic_index import get_topics
+from common_operations import warn_if_retrieval_stale, regenerate_fresh_option
 from io import BytesIO
 import re
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
-
-bedrock_runtime = boto3.client('bedrock-runtime',
-                               aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                               aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                               region_name=os.getenv('AWS_REGION')
-                               )
-bedrock_agent_runtime = boto3.client(service_name='bedrock-agent-runtime', region_name=os.getenv('AWS_REGION'))
+s3 = lazy_client('s3')
+
 
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 ARIFACTS_BUCKET_NAME = os.getenv('S3_ARTIFACTS_BUCKET_NAME')
-KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
-
-def generate_bulleted_content(content):
+# Slide texts generated in parallel while building a deck
+SLIDE_MAX_WORKERS = int(os.getenv('SLIDE_MAX_WORKERS', '8'))
+# Slides whose bullets and notes are requested together in one structured call
+SLIDES_PER_REQUEST = int(os.getenv('SLIDES_PER_REQUEST', '4'))
+# Output budget per slide in a structured call: about 300 tokens of bullets and 500 of notes
+SLIDE_TEXT_TOKENS = 800
+BULLET_SLIDE_TYPES = ['Title&Text', 'Other']
+
+def generate_bulleted_content(content, fresh=False):
     prompt = f"Based on the following content, generate 3-4 concise bullet points that summarize the key ideas:\n\n{content}"
 
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 300,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "top_p": 1.0,
-        })
-    )
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text'].strip()
-
-def generate_conclusion_summary(structure):
+    return invoke_text(prompt, max_tokens=300, fresh=fresh)
+
+def generate_conclusion_summary(structure, fresh=False):
     content = "\n".join([slide['content'] for slide in structure if slide['type'] in ['Title&Text', 'Other']])
     prompt = f"Based on the following content from the presentation, generate a concise conclusion summary with 3-4 bullet points:\n\n{content}"
 
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 300,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "top_p": 1.0,
-        })
-    )
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text'].strip()
+    return invoke_text(prompt, max_tokens=300, fresh=fresh)
 
 
 
@@ -110,44 +83,122 @@ def parse_presentation_structure(structure, subject, chapter, selected_topics):
     return slides
 
 
-def generate_slide_notes(slide_content):
+def generate_slide_notes(slide_content, fresh=False):
     prompt = f"Generate detailed speaker notes for the following slide content:\n\n{slide_content}"
 
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 500,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "top_p": 1.0,
-        })
-    )
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text'].strip()
-
-def generate_image(prompt):
+    return invoke_text(prompt, max_tokens=500, fresh=fresh)
+
+def generate_image(prompt, fresh=False):
     try:
-        response = bedrock_runtime.invoke_model(
-            modelId="stability.stable-diffusion-xl-v1",
-            contentType="application/json",
-            accept="image/png",
-            body=json.dumps({
-                "text_prompts": [{"text": prompt}],
-                "cfg_scale": 10,
-                "steps": 50,
-                "seed": 42,
-            })
-        )
-        return response['body'].read()
+        return invoke_raw(STABLE_DIFFUSION_XL, {
+            "text_prompts": [{"text": prompt}],
+            "cfg_scale": 10,
+            "steps": 50,
+            "seed": 42,
+        }, accept="image/png", fresh=fresh)
     except Exception as e:
         st.error(f"Error generating image: {str(e)}")
         return None
 
 
-def create_powerpoint(structure):
+def parse_slide_items(reply):
+    # The complete objects of the JSON array in the reply. A reply cut off by max_tokens
+    # still yields every slide it finished; parsing stops at the first incomplete object.
+    decoder = json.JSONDecoder()
+    position = reply.find('[')
+    items = []
+    if position < 0:
+        return items
+    position += 1
+    while True:
+        while position < len(reply) and reply[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(reply) or reply[position] == ']':
+            return items
+        try:
+            item, position = decoder.raw_decode(reply, position)
+        except ValueError:
+            return items
+        items.append(item)
+
+
+def generate_slide_chunk(structure, indexes, fresh=False):
+    # One structured call for the bullets and notes of several slides.
+    # Returns {(slide index, 'bullets' | 'notes'): text} for the slides that passed validation.
+    slides = [{"id": i, "type": structure[i]['type'], "title": structure[i]['title'],
+               "content": structure[i]['content'], "needs_bullets": structure[i]['type'] in BULLET_SLIDE_TYPES}
+              for i in indexes]
+    prompt = f"""You are preparing a lecture presentation. For each slide below, write:
+    - "bullets": 3-4 concise bullet points that summarize the key ideas of the slide content (only when "needs_bullets" is true, otherwise an empty string)
+    - "notes": detailed speaker notes for the slide content
+    Slides:
+    {json.dumps(slides, ensure_ascii=False, indent=2)}
+    Return only a JSON array with one object per slide, in this format:
+    [{{"id": <slide id>, "bullets": "<bullet points, one per line>", "notes": "<speaker notes>"}}]
+    """
+    reply = invoke_text(prompt, max_tokens=min(4096, SLIDE_TEXT_TOKENS * len(indexes)), fresh=fresh)
+    items = parse_slide_items(reply)
+    if len(items) < len(indexes):
+        logger.warning(f"Slide texts for slides {indexes} were incomplete: {len(items)} slides parsed")
+
+    texts = {}
+    for item in items:
+        i = item.get('id') if isinstance(item, dict) else None
+        if i not in indexes:
+            continue
+        notes, bullets = item.get('notes'), item.get('bullets')
+        if not isinstance(notes, str) or not notes.strip():
+            continue
+        if structure[i]['type'] in BULLET_SLIDE_TYPES:
+            if not isinstance(bullets, str) or not bullets.strip():
+                continue
+            texts[(i, 'bullets')] = bullets.strip()
+        texts[(i, 'notes')] = notes.strip()
+    return texts
+
+
+def generate_slide_texts(structure, fresh=False, on_progress=None):
+    # Bullets and speaker notes for every slide: first in a few structured calls of
+    # SLIDES_PER_REQUEST slides each, then one call per text for slides that failed validation.
+    # Returns {(slide index, 'bullets' | 'notes'): text}; texts whose call failed are left out.
+    tasks = []
+    for i, slide in enumerate(structure):
+        if slide['type'] in BULLET_SLIDE_TYPES:
+            tasks.append(((i, 'bullets'), generate_bulleted_content, slide['content']))
+        tasks.append(((i, 'notes'), generate_slide_notes, slide['content']))
+    chunks = [list(range(start, min(start + SLIDES_PER_REQUEST, len(structure))))
+              for start in range(0, len(structure), SLIDES_PER_REQUEST)]
+    texts = {}
+    with ThreadPoolExecutor(max_workers=SLIDE_MAX_WORKERS) as executor:
+        futures = [executor.submit(generate_slide_chunk, structure, chunk, fresh) for chunk in chunks]
+        for future in as_completed(futures):
+            try:
+                texts.update(future.result())
+            except Exception as e:
+                logger.error(f"Structured slide generation failed: {str(e)}")
+            if on_progress:
+                on_progress(len(texts), len(tasks))
+
+        fallback = [(key, function, content) for key, function, content in tasks if key not in texts]
+        if fallback:
+            logger.info(f"Generating {len(fallback)} slide texts one by one")
+        futures = {executor.submit(function, content, fresh): key for key, function, content in fallback}
+        failed = 0
+        for future in as_completed(futures):
+            try:
+                texts[futures[future]] = future.result()
+            except Exception as e:
+                logger.error(f"Slide text {futures[future]} could not be generated: {str(e)}")
+                failed += 1
+            if on_progress:
+                on_progress(len(texts) + failed, len(tasks))
+    return texts
+
+
+def create_powerpoint(structure, fresh=False):
+    # python-pptx (and lxml) is imported on first use to keep tool start-up fast
+    from pptx import Presentation
+    from pptx.util import Inches
     template_path = "Anyuniversity.pptx"
     try:
         prs = Presentation(template_path)
@@ -155,8 +206,15 @@ def create_powerpoint(structure):
         st.error(f"Failed to load template: {str(e)}")
         return None
 
-    progress_bar = st.progress(0)
-    total_slides = len(structure)
+    progress_bar = st.progress(0, text="Generating slide content...")
+    # Progress is updated here, in the script thread, as each model call completes
+    texts = generate_slide_texts(structure, fresh,
+                                 on_progress=lambda done, total: progress_bar.progress(
+                                     done / total, text=f"Generated {done} of {total} slide texts"))
+    missing = sum(1 for i, slide in enumerate(structure)
+                  if (i, 'notes') not in texts or (slide['type'] in BULLET_SLIDE_TYPES and (i, 'bullets') not in texts))
+    if missing:
+        st.warning(f"{missing} slides could not be fully generated; they use the slide content as it is.")
 
     for i, slide in enumerate(structure):
         slide_type = slide['type']
@@ -184,7 +242,7 @@ def create_powerpoint(structure):
             tf.text = slide['title']
 
         if slide_type in ['Title&Text', 'Other']:
-            bulleted_content = generate_bulleted_content(slide['content'])
+            bulleted_content = texts.get((i, 'bullets'), slide['content'])
             try:
                 body_shape = slide_obj.placeholders[1]
                 body_shape.text = bulleted_content
@@ -207,9 +265,7 @@ def create_powerpoint(structure):
 
         notes_slide = slide_obj.notes_slide
         text_frame = notes_slide.notes_text_frame
-        text_frame.text = generate_slide_notes(slide['content'])
-
-        progress_bar.progress((i + 1) / total_slides)
+        text_frame.text = texts.get((i, 'notes'), '')
 
     pptx_buffer = BytesIO()
     prs.save(pptx_buffer)
@@ -255,7 +311,7 @@ def review_and_edit_structure(structure):
 
 
 
-def generate_presentation_structure(subject, chapter, selected_topics, lecture_length):
+def generate_presentation_structure(subject, chapter, selected_topics, lecture_length, fresh=False):
     num_slides = lecture_length // 3
 
     query = f"""Retrieve information for a presentation on:
@@ -263,19 +319,9 @@ def generate_presentation_structure(subject, chapter, selected_topics, lecture_l
     Chapter: {chapter}
     Topics: {', '.join(selected_topics)}
     """
-    agent_response = bedrock_agent_runtime.retrieve(
-        knowledgeBaseId=KNOWLEDGE_BASE_ID,
-        retrievalQuery={'text': query},
-        retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 6}}
-    )
-
-    context = "Based on the following information:\n\n"
-    for result in agent_response['retrievalResults']:
-        if 'text' in result['content']:
-            context += f"- {result['content']['text']}\n"
-        elif 'byteContent' in result['content']:
-            content_type = result['content']['byteContent'].split(';')[0].split(':')[1]
-            context += f"- [Content of type: {content_type}]\n"
+    results = retrieve(query, number_of_results=6)
+
+    context = build_context(results)
 
     prompt = f"""{context}
     As an AI assistant for teachers, create a detailed structure for a PowerPoint presentation on the following:
@@ -299,20 +345,7 @@ def generate_presentation_structure(subject, chapter, selected_topics, lecture_l
     Give me the output I asked for in my format without any extra comment from you about it.
     """
 
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 2500,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "top_p": 1.0,
-        })
-    )
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text'].strip()
+    return invoke_text(prompt, max_tokens=2500, fresh=fresh)
 
 def lecture_planner():
     with st.expander("📚 Click here for Tool Instructions"):
@@ -361,6 +394,7 @@ def lecture_planner():
                                                 index=chapters.index(st.session_state.chapter) if st.session_state.chapter in chapters else 0)
 
         if st.session_state.chapter:
+            warn_if_retrieval_stale()
             topics = get_topics(st.session_state.subject, st.session_state.chapter)
             st.session_state.selected_topics = st.multiselect("Select Topics to Cover", topics,
                                                               key="LECTUREPLANNERTopicsSelector",
@@ -376,13 +410,15 @@ def lecture_planner():
                     key="LECTUREPLANNERLengthInput"
                 )
 
+                fresh = regenerate_fresh_option("LECTUREPLANNERFresh")
                 if st.button("Generate Presentation Structure", key="LECTUREPLANNERPresentationButtonCreator"):
                     with st.spinner("Generating presentation structure..."):
                         st.session_state.structure = generate_presentation_structure(
                             st.session_state.subject,
                             st.session_state.chapter,
                             st.session_state.selected_topics,
-                            st.session_state.lecture_length
+                            st.session_state.lecture_length,
+                            fresh
                         )
                         st.session_state.parsed_structure = parse_presentation_structure(st.session_state.structure, st.session_state.subject, st.session_state.chapter, st.session_state.selected_topics)
                         st.success("Presentation structure generated successfully!")
@@ -404,7 +440,7 @@ def lecture_planner():
                     if st.button("Create PowerPoint Presentation"):
                         if st.session_state.parsed_structure:
                             with st.spinner("Creating PowerPoint presentation..."):
-                                pptx_buffer = create_powerpoint(st.session_state.parsed_structure)
+                                pptx_buffer = create_powerpoint(st.session_state.parsed_structure, fresh)
 
                             if pptx_buffer:
                                 st.download_button(
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Cache of model responses keyed by a fingerprint of model ID, request parameters and
+# prompt. The local tier is a SQLite file with TTL and size-based (least recently used)
+# eviction; setting LLM_CACHE_S3_BUCKET adds a tier shared by every app instance.
+s3 = lazy_client('s3')
+
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'aiforlecture-llm-cache.sqlite3'))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+LLM_CACHE_S3_BUCKET = os.getenv('LLM_CACHE_S3_BUCKET')
+LLM_CACHE_S3_PREFIX = 'llm-cache/'
+
+_lock = threading.Lock()
+_connection = None
+
+
+def fingerprint(model_id, body, accept="application/json"):
+    canonical = json.dumps({"model": model_id, "accept": accept, "body": body}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False)
+        _connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                   key TEXT PRIMARY KEY,
+                                   body BLOB NOT NULL,
+                                   size INTEGER NOT NULL,
+                                   created_at REAL NOT NULL,
+                                   accessed_at REAL NOT NULL)""")
+        _connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        _connection.commit()
+    return _connection
+
+
+def _local_get(key):
+    now = time.time()
+    with _lock:
+        db = _db()
+        row = db.execute("SELECT body, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > LLM_CACHE_TTL_SECONDS:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            db.commit()
+            return None
+        db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        db.commit()
+        return row[0]
+
+
+def _local_put(key, body, created_at=None):
+    if len(body) > LLM_CACHE_MAX_BYTES:
+        return
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute("INSERT OR REPLACE INTO responses (key, body, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                   (key, body, len(body), created_at or now, now))
+        db.execute("DELETE FROM responses WHERE created_at < ?", (now - LLM_CACHE_TTL_SECONDS,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > LLM_CACHE_MAX_BYTES:
+            # Drop least recently used entries until the cache fits again
+            for stale_key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                if total <= LLM_CACHE_MAX_BYTES:
+                    break
+                db.execute("DELETE FROM responses WHERE key = ?", (stale_key,))
+                total -= size
+        db.commit()
+
+
+def _s3_get(key):
+    try:
+        response = s3.get_object(Bucket=LLM_CACHE_S3_BUCKET, Key=LLM_CACHE_S3_PREFIX + key)
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    created_at = response['LastModified'].timestamp()
+    if datetime.now(timezone.utc).timestamp() - created_at > LLM_CACHE_TTL_SECONDS:
+        return None, None
+    return response['Body'].read(), created_at
+
+
+def get(key):
+    # Returns the cached response bytes, or None
+    try:
+        body = _local_get(key)
+        if body is None and LLM_CACHE_S3_BUCKET:
+            body, created_at = _s3_get(key)
+            if body is not None:
+                _local_put(key, body, created_at)
+        return body
+    except Exception as e:
+        # A broken cache must never block generation
+        logger.error(f"LLM cache read failed: {str(e)}")
+        return None
+
+
+def put(key, body):
+    try:
+        _local_put(key, body)
+        if LLM_CACHE_S3_BUCKET:
+            s3.put_object(Bucket=LLM_CACHE_S3_BUCKET, Key=LLM_CACHE_S3_PREFIX + key, Body=body)
+    except Exception as e:
+        logger.error(f"LLM cache write failed: {str(e)}")
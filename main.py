@@ -1,14 +1,7 @@
 import streamlit as st
 from dotenv import load_dotenv
-from manage_subjects import manage_subjects
-from manage_chapters import manage_chapters
-from upload_materials import upload_materials
-from Topics_Summarizer import topicsSummary
-from topicSummaryCreator import topicSummaryCreator
-from Elaborate import ElaborativeOutputyCreator
-from LectureAnalyzer import lecture_analyzer
-from lecture_planner import lecture_planner
-import base64
+import importlib
+from static_assets import background_css
 
 # Set page config to wide mode
 st.set_page_config(layout="wide")
@@ -27,22 +20,11 @@ if 'new_topics' not in st.session_state:
 load_dotenv()
 
 # Add background image
-def add_bg_from_local(image_file):
-    with open(image_file, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode()
-    st.markdown(
-    f"""
-    <style>
-    .stApp {{
-        background-image: url(data:image/png;base64,{encoded_string});
-        background-size: cover;
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True
-    )
-
-add_bg_from_local('bg.jpg')
+def add_bg_from_static(image_file):
+    # The image is served from ./static, so only a short CSS rule is sent on each rerun
+    st.markdown(background_css(image_file), unsafe_allow_html=True)
+
+add_bg_from_static('bg.jpg')
 st.markdown("""
 <style>
     /* Main container styling */
@@ -203,30 +185,51 @@ st.markdown("""
 
 </style>
 """, unsafe_allow_html=True)
+
+# Selector widgets (subject, chapter, document, video) whose values are kept while another tool is shown.
+# Button keys must not match: Streamlit rejects assigning a button's state.
+PERSISTENT_WIDGET_PREFIXES = ("manage_chapters_", "upload_materials_", "topicsSummary", "subject_", "chapter_",
+                              "subject2_", "chapter2_", "Lecture Analyzer ", "LECTUREPLANNERSubject",
+                              "LECTUREPLANNERChapter", "LECTUREPLANNERTopics", "LECTUREPLANNERLength")
+
+
+def keep_widget_state():
+    # Streamlit drops the state of widgets that are not rendered in a run, and only the
+    # selected tool renders now. Re-assigning the selector keys keeps them across switches.
+    for key in list(st.session_state.keys()):
+        if isinstance(key, str) and key.startswith(PERSISTENT_WIDGET_PREFIXES):
+            st.session_state[key] = st.session_state[key]
+
+
+def lazy_tool(module_name, function_name):
+    # The tool module and its heavy dependencies are imported the first time the tool is opened
+    def run_tool():
+        getattr(importlib.import_module(module_name), function_name)()
+    run_tool.__name__ = function_name
+    return run_tool
+
+
 def main():
     st.title("AI-Powered Content Generation Teacher-Assistant")
 
     # Add some padding
     st.markdown("<br>", unsafe_allow_html=True)
-    tab_titles = ["Subjects Manager", "Syllabus Outliner", "Reference Materials", "Syllabus Topics", "Lessons' Summaries", "Elaborative Materials", "Lecture Analyzer", "Lecture Planner"]
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(tab_titles)
-
-    with tab1:
-        manage_subjects()
-    with tab2:
-        manage_chapters()
-    with tab3:
-        upload_materials()
-    with tab4:
-        topicsSummary()
-    with tab5:
-        topicSummaryCreator()
-    with tab6:
-        ElaborativeOutputyCreator()
-    with tab7:
-        lecture_analyzer()
-    with tab8:
-        lecture_planner()
+    keep_widget_state()
+    # Only the selected tool runs on each rerun
+    pages = [
+        st.Page(lazy_tool("manage_subjects", "manage_subjects"), title="Subjects Manager", default=True),
+        st.Page(lazy_tool("manage_chapters", "manage_chapters"), title="Syllabus Outliner"),
+        st.Page(lazy_tool("upload_materials", "upload_materials"), title="Reference Materials"),
+        st.Page(lazy_tool("Topics_Summarizer", "topicsSummary"), title="Syllabus Topics"),
+        st.Page(lazy_tool("topicSummaryCreator", "topicSummaryCreator"), title="Lessons' Summaries"),
+        st.Page(lazy_tool("Elaborate", "ElaborativeOutputyCreator"), title="Elaborative Materials"),
+        st.Page(lazy_tool("LectureAnalyzer", "lecture_analyzer"), title="Lecture Analyzer"),
+        st.Page(lazy_tool("lecture_planner", "lecture_planner"), title="Lecture Planner"),
+    ]
+    admin_pages = [
+        st.Page(lazy_tool("usage_dashboard", "usage_dashboard"), title="Usage Dashboard"),
+    ]
+    st.navigation({"Tools": pages, "Admin": admin_pages}).run()
     # Add some padding at the bottom
     st.markdown("<br><br>", unsafe_allow_html=True)
 
@@ -1,19 +1,15 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
 import os
 from dotenv import load_dotenv
-from common_operations import confirm_delete, create_list_item
+from common_operations import confirm_delete, create_list_item, show_deletion_failures, show_ingestion_status
 from subjects import get_subjects
 from chapters import get_chapters, delete_chapter, create_chapter
 import json
 from uuid import uuid4
 load_dotenv()
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
+s3 = lazy_client('s3')
 # S3 bucket name
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 
@@ -35,6 +31,8 @@ def manage_chapters():
 
     if selected_subject:
         chapters = get_chapters(selected_subject)
+        show_deletion_failures()
+        show_ingestion_status()
 
         st.subheader(f"Subject Chapters")
         if not chapters:
@@ -1,18 +1,14 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
 import os
 from dotenv import load_dotenv
-from common_operations import confirm_delete, create_list_item
+from common_operations import confirm_delete, create_list_item, show_deletion_failures, show_ingestion_status
 from subjects import get_subjects, delete_subject, create_subject
 import json
 from uuid import uuid4
 load_dotenv()
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
+s3 = lazy_client('s3')
 # S3 bucket name
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 
@@ -27,6 +23,8 @@ def manage_subjects():
         3. To create a new subject, enter the subject name in the "Create New Subject" section and click "Create Subject".
         """)
     subjects = get_subjects()
+    show_deletion_failures()
+    show_ingestion_status()
 
     st.subheader("Current Subjects")
     if not subjects:
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+from s3_listing import iter_keys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Subject metadata is stored as one small record per file:
+#   {subject}/subject_metadata/{chapter}/{filename}.json
+# plus a compacted subject index at {subject}/subject_metadata.json that is rebuilt
+# from the records. Every write is a compare-and-swap on the object's ETag.
+s3 = lazy_client('s3')
+BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
+
+RECORDS_FOLDER = 'subject_metadata'
+INDEX_FORMAT = 'records'
+CAS_MAX_ATTEMPTS = 8
+COMPACTION_INTERVAL_SECONDS = int(os.getenv('METADATA_COMPACTION_SECONDS', '300'))
+READ_MAX_WORKERS = 16
+
+_last_compaction = {}
+# Subjects with a background compaction waiting to run
+_scheduled_compactions = set()
+_migrated_subjects = set()
+_state_lock = threading.Lock()
+
+
+def record_key(subject, chapter, filename):
+    return f"{subject}/{RECORDS_FOLDER}/{chapter}/{filename}.json"
+
+
+def chapter_records_prefix(subject, chapter):
+    return f"{subject}/{RECORDS_FOLDER}/{chapter}/"
+
+
+def index_key(subject):
+    return f"{subject}/subject_metadata.json"
+
+
+def _is_conflict(error):
+    return error.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict')
+
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+
+
+def _read_json(key):
+    # Returns (document, etag); (None, None) when the object does not exist
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response['Body'].read().decode('utf-8')), response['ETag']
+
+
+def _write_json(key, document, etag):
+    # Conditional write: replace only the version we read, or create only if still absent
+    body = json.dumps(document, ensure_ascii=False, indent=2)
+    conditions = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=body, ContentType='application/json', **conditions)
+
+
+def _new_record(chapter, filename):
+    return {"filename": filename, "chapter": chapter, "topics": ""}
+
+
+def ensure_migrated(subject):
+    # Subjects created before per-file records only have the full index. Copy its
+    # entries into records once, so later compactions do not drop them.
+    if subject in _migrated_subjects:
+        return
+    index, _ = _read_json(index_key(subject))
+    if index and index.get('format') != INDEX_FORMAT:
+        for entry in index.get('files', []):
+            try:
+                _write_json(record_key(subject, entry['chapter'], entry['filename']), entry, None)
+            except s3.exceptions.ClientError as e:
+                # Already migrated by another writer
+                if not _is_conflict(e):
+                    raise
+        _compact(subject)
+    with _state_lock:
+        _migrated_subjects.add(subject)
+
+
+def update_file_record(subject, chapter, filename, mutate, compact=True):
+    # mutate(record) returns the new record; it is re-applied on every conflict retry.
+    # Batch writers pass compact=False and call compact_subject_index once at the end.
+    ensure_migrated(subject)
+    key = record_key(subject, chapter, filename)
+    for attempt in range(CAS_MAX_ATTEMPTS):
+        record, etag = _read_json(key)
+        updated = mutate(dict(record) if record else _new_record(chapter, filename))
+        if updated == record:
+            break
+        try:
+            _write_json(key, updated, etag)
+            break
+        except s3.exceptions.ClientError as e:
+            if not _is_conflict(e):
+                raise
+            logger.info(f"Metadata write conflict on {key}, retrying (attempt {attempt + 1})")
+            _backoff(attempt)
+    else:
+        raise RuntimeError(f"Could not update metadata for '{filename}' after {CAS_MAX_ATTEMPTS} attempts")
+    if compact:
+        maybe_compact(subject)
+    return updated
+
+
+def delete_file_record(subject, chapter, filename):
+    ensure_migrated(subject)
+    s3.delete_object(Bucket=BUCKET_NAME, Key=record_key(subject, chapter, filename))
+    maybe_compact(subject)
+
+
+def get_file_record(subject, chapter, filename):
+    record, _ = _read_json(record_key(subject, chapter, filename))
+    if record is None and subject not in _migrated_subjects:
+        index, _ = _read_json(index_key(subject))
+        if index and index.get('format') != INDEX_FORMAT:
+            record = next((entry for entry in index.get('files', [])
+                           if entry['filename'] == filename and entry['chapter'] == chapter), None)
+    return record
+
+
+def _read_records(keys):
+    with ThreadPoolExecutor(max_workers=READ_MAX_WORKERS) as executor:
+        return [record for record, _ in executor.map(_read_json, keys) if record is not None]
+
+
+def list_chapter_records(subject, chapter):
+    # Reads only the records of one chapter
+    records = _read_records(list(iter_keys(s3, BUCKET_NAME, chapter_records_prefix(subject, chapter))))
+    if not records and subject not in _migrated_subjects:
+        index, _ = _read_json(index_key(subject))
+        if index and index.get('format') != INDEX_FORMAT:
+            records = [entry for entry in index.get('files', []) if entry['chapter'] == chapter]
+    return records
+
+
+def get_subject_index(subject):
+    index, _ = _read_json(index_key(subject))
+    return index or {"files": []}
+
+
+def compact_subject_index(subject):
+    # Rebuilds the subject index from the per-file records. If that fails, a background
+    # compaction is scheduled instead, so the caller's record writes still stand.
+    ensure_migrated(subject)
+    try:
+        _compact(subject)
+    except Exception as e:
+        logger.error(f"Compaction of subject metadata for '{subject}' failed, retrying in the background: {str(e)}")
+        maybe_compact(subject)
+
+
+def _compact(subject):
+    key = index_key(subject)
+    for attempt in range(CAS_MAX_ATTEMPTS):
+        _, etag = _read_json(key)
+        records = _read_records(list(iter_keys(s3, BUCKET_NAME, f"{subject}/{RECORDS_FOLDER}/")))
+        if etag is None and not records:
+            # Nothing to index, e.g. the subject was deleted after the write that scheduled this
+            return
+        index = {
+            "format": INDEX_FORMAT,
+            "compacted_at": datetime.now(timezone.utc).isoformat(),
+            "files": sorted(records, key=lambda record: (record['chapter'], record['filename'])),
+        }
+        try:
+            _write_json(key, index, etag)
+            break
+        except s3.exceptions.ClientError as e:
+            if not _is_conflict(e):
+                raise
+            _backoff(attempt)
+    else:
+        raise RuntimeError(f"Could not compact the metadata of '{subject}' after {CAS_MAX_ATTEMPTS} attempts")
+    with _state_lock:
+        _last_compaction[subject] = time.monotonic()
+
+
+def maybe_compact(subject):
+    # Compacts at most once per COMPACTION_INTERVAL_SECONDS. A write inside that window
+    # schedules one trailing compaction at its end, so the index always catches up with
+    # the last write instead of waiting for the next one.
+    with _state_lock:
+        last = _last_compaction.get(subject)
+    _schedule_compaction(subject, 0.0 if last is None else last + COMPACTION_INTERVAL_SECONDS - time.monotonic())
+
+
+def _schedule_compaction(subject, delay):
+    with _state_lock:
+        if subject in _scheduled_compactions:
+            return
+        _scheduled_compactions.add(subject)
+    # Compaction runs in the background so the write that triggered it returns immediately
+    timer = threading.Timer(max(0.0, delay), _compact_quietly, args=(subject,))
+    timer.daemon = True
+    timer.start()
+
+
+def _compact_quietly(subject):
+    # Writes that land from here on schedule another compaction; earlier ones are included in this one
+    with _state_lock:
+        _scheduled_compactions.discard(subject)
+    try:
+        _compact(subject)
+    except Exception as e:
+        logger.error(f"Compaction of subject metadata for '{subject}' failed, retrying in "
+                     f"{COMPACTION_INTERVAL_SECONDS}s: {str(e)}")
+        _schedule_compaction(subject, COMPACTION_INTERVAL_SECONDS)
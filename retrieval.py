@@ -0,0 +1,62 @@
+import os
+import json
+import threading
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+import ingestion
+
+load_dotenv()
+
+# Process-wide cache of Knowledge Base retrievals keyed by (knowledge base, query,
+# numberOfResults, filter). Each entry is tagged with the last ingestion completed by
+# this process and the newest completed ingestion job of the data source, so a finished
+# sync, from this process or any other, invalidates every result retrieved before it.
+# The TTL bounds staleness from documents ingested directly by other processes, which
+# leave no job behind.
+bedrock_agent_runtime = lazy_client('bedrock-agent-runtime')
+KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
+
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv('RETRIEVAL_CACHE_TTL_SECONDS', '300'))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv('RETRIEVAL_CACHE_MAX_ENTRIES', '1024'))
+
+_cache = TTLCache(maxsize=RETRIEVAL_CACHE_MAX_ENTRIES, ttl=RETRIEVAL_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+
+
+def retrieve(query, number_of_results, retrieval_filter=None, knowledge_base_id=None):
+    # Returns the list of retrievalResults for the query
+    knowledge_base_id = knowledge_base_id or KNOWLEDGE_BASE_ID
+    key = (knowledge_base_id, query, number_of_results,
+           json.dumps(retrieval_filter, sort_keys=True) if retrieval_filter else None)
+    ingestion_tag = (ingestion.get_status(knowledge_base_id)['last_completed_job_id'],
+                     ingestion.latest_completed_job_id(knowledge_base_id))
+    with _lock:
+        cached = _cache.get(key)
+    if cached and cached[0] == ingestion_tag:
+        return list(cached[1])
+
+    vector_search = {'numberOfResults': number_of_results}
+    if retrieval_filter:
+        vector_search['filter'] = retrieval_filter
+    response = bedrock_agent_runtime.retrieve(
+        knowledgeBaseId=knowledge_base_id,
+        retrievalQuery={'text': query},
+        retrievalConfiguration={'vectorSearchConfiguration': vector_search}
+    )
+    results = tuple(response['retrievalResults'])
+    with _lock:
+        _cache[key] = (ingestion_tag, results)
+    return list(results)
+
+
+def build_context(results):
+    # Prompt preamble listing the retrieved passages
+    context = "Based on the following information:\n\n"
+    for result in results:
+        if 'text' in result['content']:
+            context += f"- {result['content']['text']}\n"
+        elif 'byteContent' in result['content']:
+            content_type = result['content']['byteContent'].split(';')[0].split(':')[1]
+            context += f"- [Content of type: {content_type}]\n"
+    return context
@@ -0,0 +1,18 @@
+# Streaming S3 listing helpers. Every listing in the app goes through these so that
+# prefixes with more than 1000 keys are read completely, one page at a time.
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+def iter_objects(s3, bucket, prefix='', page_size=DEFAULT_PAGE_SIZE):
+    # Yields object summaries lazily; at most one page is held in memory.
+    # Callers can stop iterating at any point to end the listing early.
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix,
+                                   PaginationConfig={'PageSize': page_size}):
+        yield from page.get('Contents', [])
+
+
+def iter_keys(s3, bucket, prefix='', page_size=DEFAULT_PAGE_SIZE):
+    for obj in iter_objects(s3, bucket, prefix, page_size):
+        yield obj['Key']
@@ -0,0 +1,38 @@
+import functools
+import io
+import os
+
+# Images used by the UI and by generated PDFs, loaded once per process.
+ASSETS_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGO_PATH = os.path.join(ASSETS_DIR, "logo.png")
+# Files in ./static are served by Streamlit (server.enableStaticServing) and cached by the browser
+STATIC_URL = "app/static"
+
+
+def static_url(filename):
+    return f"{STATIC_URL}/{filename}"
+
+
+@functools.lru_cache(maxsize=None)
+def background_css(filename):
+    return f"""
+    <style>
+    .stApp {{
+        background-image: url({static_url(filename)});
+        background-size: cover;
+    }}
+    </style>
+    """
+
+
+@functools.lru_cache(maxsize=None)
+def logo_bytes():
+    with open(LOGO_PATH, "rb") as logo_file:
+        return logo_file.read()
+
+
+@functools.lru_cache(maxsize=None)
+def logo_image_reader():
+    # Decoded once and reused by every page callback of every generated PDF
+    from reportlab.lib.utils import ImageReader
+    return ImageReader(io.BytesIO(logo_bytes()))
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read their configuration at import, so it is set before any test imports them.
+# Local caches and logs go to a scratch folder instead of the app's.
+_scratch = tempfile.mkdtemp(prefix='aiforlecture-tests-')
+for name, value in {
+    'S3_BUCKET_NAME': 'materials',
+    'S3_ARTIFACTS_BUCKET_NAME': 'artifacts',
+    'BEDROCK_KNOWLEDGE_BASE_ID': 'kb-local',
+    'BEDROCK_DATA_SOURCE_ID': 'ds-local',
+    'BEDROCK_BATCH_ROLE_ARN': 'arn:aws:iam::000000000000:role/local-batch',
+    'AWS_REGION': 'us-east-1',
+    'LLM_CACHE_PATH': os.path.join(_scratch, 'llm-cache.sqlite3'),
+    'CONTENT_CACHE_DIR': os.path.join(_scratch, 'content-cache'),
+    'USAGE_LOG_PATH': os.path.join(_scratch, 'usage.jsonl'),
+}.items():
+    os.environ[name] = value
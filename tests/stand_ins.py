@@ -0,0 +1,258 @@
+import io
+import json
+import hashlib
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+# In-memory stand-ins for the AWS APIs the app calls, for running its pipelines locally.
+# Each one implements only the operations and parameters the app uses.
+
+
+def client_error(code, message, operation_name, status_code=400):
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode': status_code}}, operation_name)
+
+
+class LocalBedrockAgent:
+    # Knowledge Base ingestion API. Directly ingested documents are indexed at once and
+    # ingestion jobs complete on their first poll. With direct_ingestion=False the
+    # document calls fail like a data source that does not support them.
+    def __init__(self, direct_ingestion=True):
+        self.direct_ingestion = direct_ingestion
+        # Document S3 URI -> {'status', 'metadata_uri'}
+        self.documents = {}
+        self.jobs = {}
+        # (operation, parameters) in call order
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, operation, parameters):
+        with self._lock:
+            self.calls.append((operation, parameters))
+
+    def operations(self):
+        with self._lock:
+            return [operation for operation, _ in self.calls]
+
+    def ingest_knowledge_base_documents(self, knowledgeBaseId, dataSourceId, documents):
+        self._record('ingest_knowledge_base_documents', {'documents': documents})
+        if not self.direct_ingestion:
+            raise client_error('ValidationException', 'Direct ingestion is not supported for this data source',
+                               'IngestKnowledgeBaseDocuments')
+        details = []
+        for document in documents:
+            uri = document['content']['s3']['s3Location']['uri']
+            self.documents[uri] = {'status': 'INDEXED', 'metadata_uri': document['metadata']['s3Location']['uri']}
+            details.append({'identifier': {'dataSourceType': 'S3', 's3': {'uri': uri}}, 'status': 'STARTING'})
+        return {'documentDetails': details}
+
+    def delete_knowledge_base_documents(self, knowledgeBaseId, dataSourceId, documentIdentifiers):
+        self._record('delete_knowledge_base_documents', {'documentIdentifiers': documentIdentifiers})
+        if not self.direct_ingestion:
+            raise client_error('ValidationException', 'Direct ingestion is not supported for this data source',
+                               'DeleteKnowledgeBaseDocuments')
+        for identifier in documentIdentifiers:
+            self.documents.pop(identifier['s3']['uri'], None)
+        return {'documentDetails': [{'identifier': identifier, 'status': 'DELETING'}
+                                    for identifier in documentIdentifiers]}
+
+    def get_knowledge_base_documents(self, knowledgeBaseId, dataSourceId, documentIdentifiers):
+        self._record('get_knowledge_base_documents', {'documentIdentifiers': documentIdentifiers})
+        return {'documentDetails': [{'identifier': identifier,
+                                     'status': self.documents.get(identifier['s3']['uri'], {}).get('status',
+                                                                                                  'NOT_FOUND')}
+                                    for identifier in documentIdentifiers]}
+
+    def start_ingestion_job(self, knowledgeBaseId, dataSourceId, description=''):
+        self._record('start_ingestion_job', {'description': description})
+        now = datetime.now(timezone.utc)
+        job = {'ingestionJobId': f"job-{len(self.jobs) + 1}", 'knowledgeBaseId': knowledgeBaseId,
+               'dataSourceId': dataSourceId, 'description': description, 'status': 'STARTING',
+               'startedAt': now, 'updatedAt': now, 'statistics': {}, 'failureReasons': []}
+        self.jobs[job['ingestionJobId']] = job
+        return {'ingestionJob': dict(job)}
+
+    def get_ingestion_job(self, knowledgeBaseId, dataSourceId, ingestionJobId):
+        self._record('get_ingestion_job', {'ingestionJobId': ingestionJobId})
+        job = self.jobs[ingestionJobId]
+        job.update(status='COMPLETE', updatedAt=datetime.now(timezone.utc))
+        return {'ingestionJob': dict(job)}
+
+    def list_ingestion_jobs(self, knowledgeBaseId, dataSourceId, filters=(), sortBy=None, maxResults=None):
+        self._record('list_ingestion_jobs', {})
+        statuses = [value for condition in filters if condition['attribute'] == 'STATUS'
+                    for value in condition['values']]
+        jobs = [job for job in self.jobs.values() if not statuses or job['status'] in statuses]
+        jobs.sort(key=lambda job: job['startedAt'], reverse=True)
+        return {'ingestionJobSummaries': [dict(job) for job in jobs[:maxResults]]}
+
+
+class NoSuchKey(ClientError):
+    pass
+
+
+def _parse_s3_uri(uri):
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+class LocalS3:
+    # Buckets kept in memory, with ETags, conditional reads and writes, and paginated listing
+    def __init__(self):
+        # (bucket, key) -> (body, etag, last_modified)
+        self.objects = {}
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey, ClientError=ClientError)
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body=b'', IfMatch=None, IfNoneMatch=None, **kwargs):
+        body = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            current = self.objects.get((Bucket, Key))
+            if (IfNoneMatch == '*' and current is not None) or \
+                    (IfMatch is not None and (current is None or current[1] != IfMatch)):
+                raise client_error('PreconditionFailed', 'At least one of the preconditions did not hold',
+                                   'PutObject', 412)
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            self.objects[(Bucket, Key)] = (body, etag, datetime.now(timezone.utc))
+        return {'ETag': etag}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read())
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        with self._lock:
+            current = self.objects.get((Bucket, Key))
+        if current is None:
+            raise NoSuchKey({'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'},
+                             'ResponseMetadata': {'HTTPStatusCode': 404}}, 'GetObject')
+        body, etag, last_modified = current
+        if IfNoneMatch == etag:
+            raise client_error('304', 'Not Modified', 'GetObject', 304)
+        return {'Body': io.BytesIO(body), 'ETag': etag, 'ContentLength': len(body), 'LastModified': last_modified}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        with self._lock:
+            for item in Delete['Objects']:
+                self.objects.pop((Bucket, item['Key']), None)
+        return {'Errors': []}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, **kwargs):
+        with self._lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+            start = int(ContinuationToken or 0)
+            page = keys[start:start + MaxKeys]
+            contents = [{'Key': key, 'Size': len(self.objects[(Bucket, key)][0]),
+                         'ETag': self.objects[(Bucket, key)][1],
+                         'LastModified': self.objects[(Bucket, key)][2]} for key in page]
+        response = {'Contents': contents, 'KeyCount': len(contents),
+                    'IsTruncated': start + MaxKeys < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+    def get_paginator(self, operation_name):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix='', PaginationConfig=None):
+                page_size = (PaginationConfig or {}).get('PageSize', 1000)
+                token = None
+                while True:
+                    page = s3.list_objects_v2(Bucket=Bucket, Prefix=Prefix, MaxKeys=page_size,
+                                              ContinuationToken=token)
+                    yield page
+                    if not page['IsTruncated']:
+                        return
+                    token = page['NextContinuationToken']
+
+        return Paginator()
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://{Params['Bucket']}.s3.local/{Params['Key']}"
+
+    def text(self, bucket, key):
+        with self._lock:
+            current = self.objects.get((bucket, key))
+        return current[0].decode('utf-8') if current else None
+
+
+def messages_response(text, input_tokens=10, output_tokens=20):
+    # A reply in the Anthropic messages schema
+    return {"type": "message", "role": "assistant", "stop_reason": "end_turn",
+            "content": [{"type": "text", "text": text}],
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}}
+
+
+class LocalBedrockRuntime:
+    # Model invocations answered by respond(prompt text) -> reply text
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, contentType="application/json", accept="application/json"):
+        with self._lock:
+            self.calls += 1
+        request = json.loads(body)
+        reply = messages_response(self.respond(request['messages'][0]['content']))
+        return {'body': io.BytesIO(json.dumps(reply).encode('utf-8')), 'ResponseMetadata': {'HTTPHeaders': {}}}
+
+
+class LocalBedrockAgentRuntime:
+    # Knowledge Base retrieval that returns the same passages for every query
+    def __init__(self, passages):
+        self.passages = passages
+        self.queries = []
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        self.queries.append(retrievalQuery['text'])
+        number_of_results = retrievalConfiguration['vectorSearchConfiguration']['numberOfResults']
+        return {'retrievalResults': [{'content': {'text': passage}} for passage in self.passages[:number_of_results]]}
+
+
+class LocalBedrockBatch:
+    # Model invocation job API over a LocalS3. A job runs on its first status poll: every
+    # input record is answered by respond(prompt text) -> reply text, or gets an error
+    # record when respond raises, and the outputs are written next to the input like
+    # Bedrock does.
+    def __init__(self, s3, respond):
+        self.s3 = s3
+        self.respond = respond
+        self.jobs = {}
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        job_id = f"job{len(self.jobs) + 1}"
+        job_arn = f"arn:aws:bedrock:local:000000000000:model-invocation-job/{job_id}"
+        self.jobs[job_arn] = {'jobArn': job_arn, 'jobName': jobName, 'modelId': modelId, 'roleArn': roleArn,
+                              'status': 'Submitted', 'inputDataConfig': inputDataConfig,
+                              'outputDataConfig': outputDataConfig}
+        return {'jobArn': job_arn}
+
+    def get_model_invocation_job(self, jobIdentifier):
+        job = self.jobs[jobIdentifier]
+        if job['status'] == 'Submitted':
+            self._run(job)
+        return dict(job)
+
+    def _run(self, job):
+        bucket, key = _parse_s3_uri(job['inputDataConfig']['s3InputDataConfig']['s3Uri'])
+        output_bucket, output_prefix = _parse_s3_uri(job['outputDataConfig']['s3OutputDataConfig']['s3Uri'])
+        lines = []
+        for line in filter(None, self.s3.text(bucket, key).splitlines()):
+            record = json.loads(line)
+            try:
+                text = self.respond(record['modelInput']['messages'][0]['content'])
+                lines.append({**record, 'modelOutput': messages_response(text)})
+            except Exception as e:
+                lines.append({**record, 'error': {'errorCode': 400, 'errorMessage': str(e)}})
+        job_id = job['jobArn'].rsplit('/', 1)[1]
+        self.s3.put_object(Bucket=output_bucket, Key=f"{output_prefix}{job_id}/{key.rsplit('/', 1)[1]}.out",
+                           Body="\n".join(json.dumps(line) for line in lines))
+        job['status'] = 'Completed'
@@ -0,0 +1,128 @@
+import os
+import re
+import sys
+import json
+import uuid
+import threading
+import subprocess
+import pytest
+import aws_clients
+import batch_inference
+import catalog
+import metadata_store
+from stand_ins import LocalS3, LocalBedrockAgent, LocalBedrockRuntime, LocalBedrockAgentRuntime, LocalBedrockBatch
+
+MATERIALS = os.environ['S3_BUCKET_NAME']
+ARTIFACTS = os.environ['S3_ARTIFACTS_BUCKET_NAME']
+
+
+def respond(prompt):
+    if 'bulleted list of the main topics' in prompt:
+        return "- Plane mirrors\n- Reflection"
+    summary = re.search(r"summary of the topic: (.+)", prompt)
+    if summary:
+        return f"Summary of {summary.group(1).strip()}"
+    elaboration = re.search(r'the following " (.+) "', prompt)
+    return f"Elaboration of {elaboration.group(1)}"
+
+
+@pytest.fixture
+def aws():
+    s3 = LocalS3()
+    clients = {
+        's3': s3,
+        'batch': LocalBedrockBatch(s3, respond),
+        'runtime': LocalBedrockRuntime(respond),
+        'agent_runtime': LocalBedrockAgentRuntime(["Light bends when it passes between two media."]),
+        'agent': LocalBedrockAgent(),
+    }
+    batch_inference.set_clients(s3, clients['batch'], clients['runtime'], clients['agent_runtime'], clients['agent'])
+    threads = set(threading.enumerate())
+    yield clients
+    # Subject index compactions run in the background; they must finish on the stand-in
+    for thread in set(threading.enumerate()) - threads:
+        thread.join(timeout=10)
+    for service_name in ('s3', 'bedrock', 'bedrock-runtime', 'bedrock-agent-runtime', 'bedrock-agent'):
+        aws_clients.set_client(service_name, None)
+
+
+@pytest.fixture
+def subject(aws):
+    # One chapter with a file whose topics are known and a file still without topics;
+    # "Refraction" already has its summary
+    subject = f"Physics-{uuid.uuid4().hex[:8]}"
+    s3 = aws['s3']
+    for key in (f"{subject}/", f"{subject}/Optics/", f"{subject}/Optics/lenses.pdf",
+                f"{subject}/Optics/lenses.pdf.metadata.json", f"{subject}/Optics/mirrors.pdf"):
+        s3.put_object(Bucket=MATERIALS, Key=key, Body=b'')
+    s3.put_object(Bucket=MATERIALS, Key=metadata_store.record_key(subject, 'Optics', 'lenses.pdf'),
+                  Body=json.dumps({"filename": "lenses.pdf", "chapter": "Optics",
+                                   "topics": "Refraction\nThin lenses"}))
+    s3.put_object(Bucket=ARTIFACTS, Key=f"{subject}/Optics/Refraction/summary.txt", Body=b'Existing summary')
+    catalog.invalidate()
+    return subject
+
+
+def assert_artifacts_saved(s3, subject):
+    assert s3.text(ARTIFACTS, f"{subject}/Optics/Refraction/summary.txt") == "Existing summary"
+    assert s3.text(ARTIFACTS, f"{subject}/Optics/Thin lenses/summary.txt") == "Summary of Thin lenses"
+    assert s3.text(ARTIFACTS, f"{subject}/Optics/Refraction/Elaborate.txt") == "Elaboration of Refraction"
+    assert s3.text(ARTIFACTS, f"{subject}/Optics/Thin lenses/Elaborate.txt") == "Elaboration of Thin lenses"
+    for key in (f"{subject}/Optics/Thin lenses/summary.pdf", f"{subject}/Optics/Refraction/Elaborate.pdf"):
+        assert s3.objects[(ARTIFACTS, key)][0].startswith(b'%PDF')
+    record = metadata_store.get_file_record(subject, 'Optics', 'mirrors.pdf')
+    assert record['topics'] == "- Plane mirrors\n- Reflection"
+
+
+def test_small_runs_are_generated_online(aws, subject):
+    report = batch_inference.run(subject, batch_inference.default_kinds())
+
+    assert report == {'saved': 4, 'failed': []}
+    assert aws['runtime'].calls == 4
+    assert not aws['batch'].jobs
+    assert_artifacts_saved(aws['s3'], subject)
+
+
+def test_large_runs_go_through_a_batch_job(aws, subject, monkeypatch):
+    monkeypatch.setattr(batch_inference, 'BATCH_MIN_RECORDS', 1)
+    monkeypatch.setattr(batch_inference, 'BATCH_POLL_MIN_SECONDS', 0)
+
+    report = batch_inference.run(subject, batch_inference.default_kinds())
+
+    assert report == {'saved': 4, 'failed': []}
+    assert aws['runtime'].calls == 0
+    [job] = aws['batch'].jobs.values()
+    assert job['status'] == 'Completed'
+    assert job['roleArn'] == os.environ['BEDROCK_BATCH_ROLE_ARN']
+    job_prefix = f"{batch_inference.BATCH_PREFIX}{job['jobName']}/"
+    manifest = json.loads(aws['s3'].text(ARTIFACTS, f"{job_prefix}manifest.json"))
+    assert manifest['subject'] == subject
+    assert sorted(manifest['records'].values()) == [
+        ['elaboration', 'Optics', 'Refraction'], ['elaboration', 'Optics', 'Thin lenses'],
+        ['summary', 'Optics', 'Thin lenses'], ['topics', 'Optics', 'mirrors.pdf']]
+    assert_artifacts_saved(aws['s3'], subject)
+
+
+def test_failed_batch_records_are_reported(aws, subject, monkeypatch):
+    monkeypatch.setattr(batch_inference, 'BATCH_MIN_RECORDS', 1)
+    monkeypatch.setattr(batch_inference, 'BATCH_POLL_MIN_SECONDS', 0)
+
+    def respond_without_elaborations(prompt):
+        if 'Elaborate' in prompt:
+            raise RuntimeError("Model output was filtered")
+        return respond(prompt)
+    aws['batch'].respond = respond_without_elaborations
+
+    report = batch_inference.run(subject, batch_inference.default_kinds())
+
+    assert report['saved'] == 2
+    assert sorted(report['failed']) == [('elaboration', ['Optics', 'Refraction'], "Model output was filtered"),
+                                        ('elaboration', ['Optics', 'Thin lenses'], "Model output was filtered")]
+
+
+@pytest.mark.parametrize('args', [[], ['--collect'], ['--kinds', 'summary'], ['--kinds', 'slides', 'Physics']])
+def test_command_line_errors_print_the_usage(args):
+    result = subprocess.run([sys.executable, batch_inference.__file__, *args], capture_output=True, text=True)
+
+    assert result.returncode == 2
+    assert batch_inference.USAGE in result.stderr
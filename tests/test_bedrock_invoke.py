@@ -0,0 +1,122 @@
+import json
+import pytest
+import bedrock_invoke
+import llm_cache
+import usage_metrics
+from stand_ins import client_error
+
+
+class FakeEvents:
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.closed = False
+
+    def __iter__(self):
+        for payload in self.payloads:
+            yield {'chunk': {'bytes': json.dumps(payload).encode('utf-8')}}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRuntime:
+    def __init__(self, error=None, events=None):
+        self.error = error
+        self.events = events
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        raise self.error
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {'body': self.events}
+
+
+@pytest.fixture
+def usage_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_metrics, 'USAGE_LOG_PATH', str(tmp_path / 'usage.jsonl'))
+    monkeypatch.setattr(bedrock_invoke, 'BEDROCK_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(bedrock_invoke, 'BEDROCK_BACKOFF_MAX_SECONDS', 0)
+    monkeypatch.setattr(llm_cache, 'get', lambda key: None)
+    monkeypatch.setattr(llm_cache, 'put', lambda key, body: None)
+    return usage_metrics.load
+
+
+def use_runtime(monkeypatch, runtime):
+    monkeypatch.setattr(bedrock_invoke, '_client', lambda model_id: runtime)
+
+
+def test_calls_that_exhaust_their_retries_are_recorded(usage_log, monkeypatch):
+    runtime = FakeRuntime(error=client_error('ThrottlingException', 'Rate exceeded', 'InvokeModel'))
+    use_runtime(monkeypatch, runtime)
+
+    with pytest.raises(Exception):
+        bedrock_invoke.invoke_text("Summarize", max_tokens=100, fresh=True)
+
+    [entry] = usage_log()
+    assert runtime.calls == 3
+    assert entry['error'] == 'ThrottlingException'
+    assert entry['retries'] == 2
+    assert entry['caller'] == 'test_bedrock_invoke.test_calls_that_exhaust_their_retries_are_recorded'
+
+
+def test_streams_that_fail_to_start_are_recorded(usage_log, monkeypatch):
+    use_runtime(monkeypatch, FakeRuntime(error=client_error('AccessDeniedException', 'Denied', 'InvokeModel')))
+
+    with pytest.raises(Exception):
+        list(bedrock_invoke.stream_text("Summarize", max_tokens=100, fresh=True))
+
+    [entry] = usage_log()
+    assert entry['error'] == 'AccessDeniedException'
+    assert entry['retries'] == 0
+    assert entry['streamed']
+
+
+def test_abandoned_streams_are_recorded(usage_log, monkeypatch):
+    events = FakeEvents([
+        {'type': 'message_start', 'message': {'usage': {'input_tokens': 42}}},
+        {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'First part. '}},
+        {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'Second part.'}},
+    ])
+    use_runtime(monkeypatch, FakeRuntime(events=events))
+
+    stream = bedrock_invoke.stream_text("Summarize", max_tokens=100, fresh=True)
+    assert next(stream) == 'First part. '
+    stream.close()
+
+    [entry] = usage_log()
+    assert entry['aborted']
+    assert entry['error'] is None
+    assert entry['input_tokens'] == 42
+    assert events.closed
+    assert bedrock_invoke._limiter(bedrock_invoke.DEFAULT_TEXT_MODEL).in_flight == 0
+
+
+def test_summaries_count_errors_and_aborted_streams():
+    entries = [
+        {'tool': 'Elaborate', 'cached': False, 'seconds': 1.0, 'input_tokens': 10, 'output_tokens': 5,
+         'retries': 0, 'cost': 0.1, 'error': None, 'aborted': False},
+        {'tool': 'Elaborate', 'cached': False, 'seconds': 9.0, 'input_tokens': None, 'output_tokens': None,
+         'retries': 5, 'cost': 0.0, 'error': 'ThrottlingException', 'aborted': False},
+        {'tool': 'Elaborate', 'cached': False, 'seconds': 2.0, 'input_tokens': 10, 'output_tokens': None,
+         'retries': 0, 'cost': 0.0, 'error': None, 'aborted': True},
+        # Entries written before failures were recorded have neither field
+        {'tool': 'Elaborate', 'cached': True, 'seconds': 0.0, 'input_tokens': None, 'output_tokens': None,
+         'retries': 0, 'cost': 0.0},
+    ]
+
+    [row] = usage_metrics.summarize(entries)
+
+    assert (row['calls'], row['errors'], row['aborted'], row['retries']) == (4, 1, 1, 5)
+    assert row['p95_seconds'] == 9.0
+
+
+def test_a_prefill_opens_the_assistant_turn():
+    body = bedrock_invoke.messages_body("Summarize", max_tokens=100, prefill="Here's a summary:")
+
+    assert body['messages'] == [{'role': 'user', 'content': "Summarize"},
+                                {'role': 'assistant', 'content': "Here's a summary:"}]
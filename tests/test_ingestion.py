@@ -0,0 +1,84 @@
+import time
+import uuid
+import pytest
+import aws_clients
+import ingestion
+from stand_ins import LocalBedrockAgent
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setattr(ingestion, 'INGESTION_DIRECT_DEBOUNCE_SECONDS', 0.05)
+    monkeypatch.setattr(ingestion, 'INGESTION_DEBOUNCE_SECONDS', 0.05)
+    monkeypatch.setattr(ingestion, 'INGESTION_POLL_MIN_SECONDS', 0.01)
+    monkeypatch.setattr(ingestion, 'INGESTION_POLL_MAX_SECONDS', 0.05)
+    monkeypatch.setattr(ingestion, 'BUCKET_NAME', 'materials')
+    agent = LocalBedrockAgent()
+    aws_clients.set_client('bedrock-agent', agent)
+    yield agent
+    aws_clients.set_client('bedrock-agent', None)
+
+
+@pytest.fixture
+def data_source():
+    # Each test gets its own scheduler state
+    return f"kb-{uuid.uuid4().hex[:8]}", f"ds-{uuid.uuid4().hex[:8]}"
+
+
+def wait_until_settled(knowledge_base_id, data_source_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = ingestion.get_status(knowledge_base_id, data_source_id)
+        if status['state'] in (ingestion.COMPLETE, ingestion.FAILED) and not status['pending_changes']:
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Ingestion did not finish: {status}")
+
+
+def test_changed_documents_are_ingested_and_removed_directly(agent, data_source):
+    agent.documents['s3://materials/Physics/Optics/old.pdf'] = {'status': 'INDEXED', 'metadata_uri': None}
+    ingestion.request_document_changes(upserts=['Physics/Optics/lenses.pdf', 'Physics/Optics/mirrors.pdf'],
+                                       reason='Uploaded 2 files', knowledge_base_id=data_source[0],
+                                       data_source_id=data_source[1])
+    ingestion.request_document_changes(deletes=['Physics/Optics/old.pdf'], reason='Deleted a file',
+                                       knowledge_base_id=data_source[0], data_source_id=data_source[1])
+
+    status = wait_until_settled(*data_source)
+
+    assert status['state'] == ingestion.COMPLETE
+    assert status['job_id'].startswith('direct-')
+    assert status['last_completed_job_id'] == status['job_id']
+    assert status['statistics']['numberOfModifiedDocumentsIndexed'] == 2
+    assert status['statistics']['numberOfDocumentsDeleted'] == 1
+    assert agent.documents == {
+        's3://materials/Physics/Optics/lenses.pdf': {
+            'status': 'INDEXED', 'metadata_uri': 's3://materials/Physics/Optics/lenses.pdf.metadata.json'},
+        's3://materials/Physics/Optics/mirrors.pdf': {
+            'status': 'INDEXED', 'metadata_uri': 's3://materials/Physics/Optics/mirrors.pdf.metadata.json'},
+    }
+    # Both requests fell in one debounce window and no full sync was started
+    assert agent.operations().count('ingest_knowledge_base_documents') == 1
+    assert 'start_ingestion_job' not in agent.operations()
+
+
+def test_falls_back_to_a_full_sync_when_direct_ingestion_fails(agent, data_source):
+    agent.direct_ingestion = False
+    ingestion.request_document_changes(upserts=['Physics/Optics/lenses.pdf'], reason='Uploaded 1 file',
+                                       knowledge_base_id=data_source[0], data_source_id=data_source[1])
+
+    status = wait_until_settled(*data_source)
+
+    assert status['state'] == ingestion.COMPLETE
+    assert status['job_id'] == 'job-1'
+    assert agent.operations().count('start_ingestion_job') == 1
+
+
+def test_large_changes_run_a_full_sync(agent, data_source, monkeypatch):
+    monkeypatch.setattr(ingestion, 'INGESTION_INCREMENTAL_MAX_DOCUMENTS', 2)
+    ingestion.request_document_changes(upserts=[f"Physics/Optics/{n}.pdf" for n in range(3)],
+                                       knowledge_base_id=data_source[0], data_source_id=data_source[1])
+
+    status = wait_until_settled(*data_source)
+
+    assert status['job_id'] == 'job-1'
+    assert 'ingest_knowledge_base_documents' not in agent.operations()
@@ -0,0 +1,68 @@
+import time
+import uuid
+import pytest
+import aws_clients
+import metadata_store
+from stand_ins import LocalS3, client_error
+
+BUCKET = metadata_store.BUCKET_NAME
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(metadata_store, 'COMPACTION_INTERVAL_SECONDS', 0.2)
+    s3 = LocalS3()
+    aws_clients.set_client('s3', s3)
+    yield s3
+    # Trailing compactions must run on the stand-in
+    wait_for(lambda: not metadata_store._scheduled_compactions)
+    aws_clients.set_client('s3', None)
+
+
+def index_topics(subject):
+    return {record['filename']: record['topics'] for record in metadata_store.get_subject_index(subject)['files']}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def set_topics(subject, filename, topics):
+    metadata_store.update_file_record(subject, 'Optics', filename, lambda record: {**record, "topics": topics})
+
+
+def test_the_index_catches_up_with_the_last_write(s3):
+    subject = f"Physics-{uuid.uuid4().hex[:8]}"
+    set_topics(subject, 'lenses.pdf', "Refraction")
+    assert wait_for(lambda: index_topics(subject) == {'lenses.pdf': "Refraction"})
+
+    # Both writes fall inside the interval after the first compaction; no write follows them
+    set_topics(subject, 'lenses.pdf', "Refraction\nThin lenses")
+    set_topics(subject, 'mirrors.pdf', "Reflection")
+
+    assert wait_for(lambda: index_topics(subject) == {'lenses.pdf': "Refraction\nThin lenses",
+                                                      'mirrors.pdf': "Reflection"})
+
+
+def test_a_compaction_that_keeps_conflicting_is_not_recorded(s3, monkeypatch):
+    subject = f"Physics-{uuid.uuid4().hex[:8]}"
+    set_topics(subject, 'lenses.pdf', "Refraction")
+    assert wait_for(lambda: index_topics(subject) == {'lenses.pdf': "Refraction"})
+    compacted_at = metadata_store._last_compaction[subject]
+
+    put_object = s3.put_object
+
+    def conflicting_put_object(**kwargs):
+        if kwargs['Key'] == metadata_store.index_key(subject):
+            raise client_error('PreconditionFailed', 'At least one of the preconditions did not hold', 'PutObject',
+                               412)
+        return put_object(**kwargs)
+    monkeypatch.setattr(s3, 'put_object', conflicting_put_object)
+    monkeypatch.setattr(metadata_store, '_backoff', lambda attempt: None)
+
+    with pytest.raises(RuntimeError):
+        metadata_store._compact(subject)
+    assert metadata_store._last_compaction[subject] == compacted_at
@@ -0,0 +1,47 @@
+import uuid
+import pytest
+import aws_clients
+import ingestion
+import retrieval
+from stand_ins import LocalBedrockAgent, LocalBedrockAgentRuntime
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setattr(ingestion, 'INGESTION_CHECK_SECONDS', 0)
+    agent = LocalBedrockAgent()
+    agent_runtime = LocalBedrockAgentRuntime(["Light bends when it passes between two media."])
+    aws_clients.set_client('bedrock-agent', agent)
+    aws_clients.set_client('bedrock-agent-runtime', agent_runtime)
+    yield agent, agent_runtime
+    aws_clients.set_client('bedrock-agent', None)
+    aws_clients.set_client('bedrock-agent-runtime', None)
+
+
+def test_a_sync_completed_elsewhere_drops_cached_results(aws):
+    agent, agent_runtime = aws
+    knowledge_base_id = f"kb-{uuid.uuid4().hex[:8]}"
+
+    retrieval.retrieve("refraction", 3, knowledge_base_id=knowledge_base_id)
+    retrieval.retrieve("refraction", 3, knowledge_base_id=knowledge_base_id)
+    assert agent_runtime.queries == ["refraction"]
+
+    # An ingestion job started and finished by another process or the console
+    job = agent.start_ingestion_job(knowledge_base_id, ingestion.DATA_SOURCE_ID)['ingestionJob']
+    agent.get_ingestion_job(knowledge_base_id, ingestion.DATA_SOURCE_ID, job['ingestionJobId'])
+
+    retrieval.retrieve("refraction", 3, knowledge_base_id=knowledge_base_id)
+    assert agent_runtime.queries == ["refraction", "refraction"]
+
+
+def test_a_failed_job_lookup_keeps_the_cache_usable(aws, monkeypatch):
+    agent, agent_runtime = aws
+    knowledge_base_id = f"kb-{uuid.uuid4().hex[:8]}"
+    retrieval.retrieve("refraction", 3, knowledge_base_id=knowledge_base_id)
+
+    def unavailable(**kwargs):
+        raise RuntimeError("Endpoint unavailable")
+    monkeypatch.setattr(agent, 'list_ingestion_jobs', unavailable)
+
+    retrieval.retrieve("refraction", 3, knowledge_base_id=knowledge_base_id)
+    assert agent_runtime.queries == ["refraction"]
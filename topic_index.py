@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import threading
+from dotenv import load_dotenv
+from aws_clients import lazy_client
+from s3_listing import iter_objects
+import metadata_store
+
+load_dotenv()
+
+# Process-wide (subject, chapter) -> deduplicated topic list, shared by the Lessons'
+# Summaries, Elaborative Materials and Lecture Planner tools. Cached entries are
+# revalidated against S3 ETags, so unchanged metadata is never downloaded again.
+s3 = lazy_client('s3')
+BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
+# Reruns within this window reuse the cached topics without asking S3
+TOPIC_INDEX_REVALIDATE_SECONDS = float(os.getenv('TOPIC_INDEX_REVALIDATE_SECONDS', '5'))
+
+_entries = {}
+_lock = threading.Lock()
+
+
+class _ChapterTopics:
+    __slots__ = ('record_etags', 'record_topics', 'index_etag', 'topics', 'checked_at')
+
+    def __init__(self):
+        # Per-file record key -> ETag / topic lines
+        self.record_etags = {}
+        self.record_topics = {}
+        # ETag of the legacy subject index, for subjects without per-file records
+        self.index_etag = None
+        self.topics = []
+        self.checked_at = None
+
+
+def _split_topics(record):
+    return [topic.strip() for topic in (record.get('topics') or '').split('\n') if topic.strip()]
+
+
+def _get_if_changed(key, etag):
+    # Conditional GET: returns None when S3 answers 304 Not Modified or the key is gone
+    conditions = {'IfNoneMatch': etag} if etag else {}
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME, Key=key, **conditions)
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    except s3.exceptions.ClientError as e:
+        if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304 or \
+                e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            return None, etag
+        raise
+    return json.loads(response['Body'].read().decode('utf-8')), response['ETag']
+
+
+def _revalidate(subject, chapter, entry):
+    # One listing returns the ETag of every record in the chapter; only changed records are fetched
+    listed = {obj['Key']: obj['ETag'] for obj in
+              iter_objects(s3, BUCKET_NAME, metadata_store.chapter_records_prefix(subject, chapter))}
+    record_topics = {}
+    for key, etag in listed.items():
+        if entry.record_etags.get(key) == etag:
+            record_topics[key] = entry.record_topics[key]
+            continue
+        record, etag = _get_if_changed(key, None)
+        if record is not None:
+            record_topics[key] = _split_topics(record)
+            listed[key] = etag
+    entry.record_etags = {key: listed[key] for key in record_topics}
+    entry.record_topics = record_topics
+    topics = [topic for key in sorted(record_topics) for topic in record_topics[key]]
+
+    if not listed:
+        # Subjects not yet migrated to per-file records keep topics in the subject index
+        index, etag = _get_if_changed(metadata_store.index_key(subject), entry.index_etag)
+        if etag is None:
+            topics = []
+        elif index is None:
+            topics = entry.topics
+        elif index.get('format') == metadata_store.INDEX_FORMAT:
+            topics = []
+        else:
+            topics = [topic for file_info in index.get('files', []) if file_info['chapter'] == chapter
+                      for topic in _split_topics(file_info)]
+        entry.index_etag = etag
+    else:
+        entry.index_etag = None
+
+    entry.topics = list(dict.fromkeys(topics))
+    entry.checked_at = time.monotonic()
+
+
+def get_topics(subject, chapter):
+    with _lock:
+        entry = _entries.get((subject, chapter))
+        if entry is None:
+            entry = _entries[(subject, chapter)] = _ChapterTopics()
+    if entry.checked_at is None or time.monotonic() - entry.checked_at > TOPIC_INDEX_REVALIDATE_SECONDS:
+        _revalidate(subject, chapter, entry)
+    return list(entry.topics)
+
+
+def invalidate(subject, chapter=None):
+    # Forces revalidation on the next read; cached ETags are kept so unchanged records are not re-fetched
+    with _lock:
+        for (entry_subject, entry_chapter), entry in _entries.items():
+            if entry_subject == subject and (chapter is None or entry_chapter == chapter):
+                entry.checked_at = None
@@ -1,42 +1,40 @@
 import streamlit as st
-import boto3
+from aws_clients import lazy_client
 import os
 from dotenv import load_dotenv
-from common_operations import confirm_delete, create_list_item
+from common_operations import confirm_delete, create_list_item, show_ingestion_status
 from subjects import get_subjects
 from chapters import get_chapters
-from files import get_files, delete_file, display_file_list, update_subject_metadata
+from files import get_files, delete_file, display_file_list
 import json
+import hashlib
 import logging
 from uuid import uuid4
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import catalog
+import ingestion
+import metadata_store
+import topic_index
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 # Initialize AWS clients
-s3 = boto3.client('s3',
-                  aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                  aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  region_name=os.getenv('AWS_REGION')
-                  )
-bedrock_agent = boto3.client('bedrock-agent',
-                                     aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                                     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                                     region_name=os.getenv('AWS_REGION')
-                                     )
+s3 = lazy_client('s3')
 
 # S3 bucket name
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
-# Bedrock Knowledge Base ID
-KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
-# Bedrock Data Source ID
-DATA_SOURCE_ID = os.getenv('BEDROCK_DATA_SOURCE_ID')
+# Batch uploads: files in flight at once, and multipart settings for each file
+UPLOAD_MAX_WORKERS = int(os.getenv('UPLOAD_MAX_WORKERS', '8'))
+UPLOAD_PART_CONCURRENCY = 4
+UPLOAD_MULTIPART_BYTES = 8 * 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
 
 
-def create_update_metadata(subject, chapter, filename):
-    # Create metadata for the file
+def create_update_metadata(subject, chapter, filename, sha256=None):
+    # Create the Knowledge Base sidecar for the file
     current_date = datetime.now().strftime("%Y%m%d")
     file_metadata = {
         "metadataAttributes": {
@@ -70,6 +68,14 @@ def create_update_metadata(subject, chapter, filename):
             }
         }
     }
+    if sha256:
+        file_metadata["metadataAttributes"]["content_sha256"] = {
+            "value": {
+                "type": "STRING",
+                "stringValue": sha256
+            },
+            "includeForEmbedding": False
+        }
 
     # Convert the metadata to a JSON string
     metadata_json = json.dumps(file_metadata, ensure_ascii=False, indent=2)
@@ -80,43 +86,99 @@ def create_update_metadata(subject, chapter, filename):
 
     logger.info(f"Metadata created for {filename}: {metadata_json}")
 
-    # Update subject-level metadata
-    update_subject_metadata(subject, chapter, filename, action='add')
-
-    # Verify the uploaded metadata
-    if verify_metadata_json(subject, chapter, filename):
-        logger.info(f"Metadata for {filename} verified successfully")
-    else:
-        logger.error(f"Failed to verify metadata for {filename}")
 
-
-def verify_metadata_json(subject, chapter, filename):
-    metadata_key = f"{subject}/{chapter}/{filename}.metadata.json"
-    try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=metadata_key)
-        metadata_content = response['Body'].read().decode('utf-8')
-        json.loads(metadata_content)  # This will raise an exception if the JSON is invalid
-        logger.info(f"Metadata for {filename} is valid JSON")
-        return True
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in metadata for {filename}: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"Error verifying metadata for {filename}: {str(e)}")
-        return False
-
-
-
-def sync_knowledge_base():
-    logger.info(f"Attempting to sync Knowledge Base. Knowledge Base ID: {KNOWLEDGE_BASE_ID}, Data Source ID: {DATA_SOURCE_ID}")
-    try:
-        response = bedrock_agent.start_ingestion_job(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            dataSourceId=DATA_SOURCE_ID
-        )
-        logger.info(f"Knowledge Base sync started successfully. Response: {response}")
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {str(e)}")
+def transfer_config():
+    # boto3's transfer module is imported on first upload to keep tool start-up fast
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=UPLOAD_MULTIPART_BYTES,
+                          multipart_chunksize=UPLOAD_MULTIPART_BYTES,
+                          max_concurrency=UPLOAD_PART_CONCURRENCY,
+                          use_threads=True)
+
+
+def content_sha256(fileobj):
+    # Streams the file through the hasher in chunks and rewinds it for the upload
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_BYTES), b''):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def known_hashes(subject, chapter):
+    # sha256 -> [(chapter, filename)] for files already in the subject. The target chapter is
+    # read from its records; other chapters come from the compacted subject index.
+    records = [record for record in metadata_store.get_subject_index(subject).get('files', [])
+               if record['chapter'] != chapter]
+    records += metadata_store.list_chapter_records(subject, chapter)
+    hashes = {}
+    for record in records:
+        if record.get('sha256'):
+            hashes.setdefault(record['sha256'], []).append((record['chapter'], record['filename']))
+    return hashes
+
+
+def upload_one(subject, chapter, uploaded_file, sha256, config):
+    s3_key = f"{subject}/{chapter}/{uploaded_file.name}"
+    s3.upload_fileobj(uploaded_file, BUCKET_NAME, s3_key, Config=config)
+    create_update_metadata(subject, chapter, uploaded_file.name, sha256)
+    # Per-file subject metadata record; the subject index is compacted once per batch
+    metadata_store.update_file_record(subject, chapter, uploaded_file.name,
+                                      lambda record: {**record, "sha256": sha256}, compact=False)
+    return s3_key
+
+
+def upload_batch(subject, chapter, uploaded_files, on_progress=None, allow_duplicates=False):
+    # Uploads files and their sidecars concurrently, then commits subject metadata and
+    # starts a single Knowledge Base sync for the whole batch. Files whose content is
+    # unchanged, or already stored elsewhere in the subject, are skipped.
+    # Returns (uploaded keys, [(filename, reason)] skipped, [(filename, error)] failures).
+    hashes = known_hashes(subject, chapter)
+    to_upload, skipped = [], []
+    for uploaded_file in uploaded_files:
+        sha256 = content_sha256(uploaded_file)
+        locations = hashes.get(sha256, [])
+        if (chapter, uploaded_file.name) in locations:
+            skipped.append((uploaded_file.name, "unchanged"))
+        elif locations and not allow_duplicates:
+            skipped.append((uploaded_file.name,
+                            "same content as " + ", ".join(f"{c}/{f}" for c, f in locations)))
+        else:
+            to_upload.append((uploaded_file, sha256))
+            hashes.setdefault(sha256, []).append((chapter, uploaded_file.name))
+
+    config = transfer_config()
+    uploaded, failures = [], []
+    total = len(uploaded_files)
+    with ThreadPoolExecutor(max_workers=UPLOAD_MAX_WORKERS) as executor:
+        futures = {executor.submit(upload_one, subject, chapter, uploaded_file, sha256, config): uploaded_file.name
+                   for uploaded_file, sha256 in to_upload}
+        for future in as_completed(futures):
+            try:
+                uploaded.append(future.result())
+            except Exception as e:
+                logger.error(f"Upload of {futures[future]} failed: {str(e)}")
+                failures.append((futures[future], str(e)))
+            if on_progress:
+                on_progress(len(skipped) + len(uploaded) + len(failures), total)
+    if uploaded:
+        catalog.invalidate(subject, chapter)
+        topic_index.invalidate(subject, chapter)
+        metadata_store.compact_subject_index(subject)
+        ingestion.request_document_changes(upserts=uploaded, reason=f"Uploaded {len(uploaded)} files to '{subject}/{chapter}'")
+    return uploaded, skipped, failures
+
+
+def show_skipped_uploads():
+    # Skipped files from the last batch survive the rerun that follows the upload
+    skipped = st.session_state.get('upload_skipped')
+    if skipped:
+        with st.expander(f"ℹ️ {len(skipped)} files were not uploaded again"):
+            for filename, reason in skipped:
+                st.write(f"{filename}: {reason}")
+            if st.button("Dismiss", key="dismiss_upload_skipped"):
+                st.session_state.upload_skipped = None
+                st.rerun()
 
 
 def upload_materials():
@@ -127,9 +189,10 @@ def upload_materials():
         2. Select a chapter from the second dropdown menu.
         3. View existing files for the selected subject and chapter.
         4. To delete a file, click the "Delete" button next to it and confirm your action.
-        5. To upload a new file:
-           - Click on "Choose a file to upload" or drag and drop a file into the designated area.
-           - Once a file is selected, click the "Upload File" button to upload it.
+        5. To upload new files:
+           - Click on "Choose files to upload" or drag and drop one or more files into the designated area.
+           - Once the files are selected, click the "Upload Files" button to upload them together.
+           - Files whose content is already stored in the chapter, or elsewhere in the subject, are skipped and listed.
         6. You can switch between subjects and chapters to manage files in different locations.
         """)
     subjects = [""] + get_subjects()
@@ -140,18 +203,31 @@ def upload_materials():
         if selected_chapter:
             files = get_files(selected_subject, selected_chapter)
             display_file_list(selected_subject, selected_chapter, files)
+            show_ingestion_status()
 
             st.subheader("Upload New File")
-            uploaded_file = st.file_uploader("Choose a file to upload", key=f"uploader_{selected_subject}_{selected_chapter}")
-            if uploaded_file is not None:
-                if st.button("Upload File"):
-                    # Upload file to S3
-                    s3_key = f"{selected_subject}/{selected_chapter}/{uploaded_file.name}"
-                    s3.upload_fileobj(uploaded_file, BUCKET_NAME, s3_key)
-                    # Create and update metadata
-                    create_update_metadata(selected_subject, selected_chapter, uploaded_file.name)
-                    st.success(f"File uploaded successfully to S3: {s3_key}")
-                    # Sync Knowledge Base
-                    sync_knowledge_base()
-                    st.rerun()
+            if 'uploader_generation' not in st.session_state:
+                st.session_state.uploader_generation = 0
+            uploaded_files = st.file_uploader("Choose files to upload", accept_multiple_files=True,
+                                              key=f"uploader_{selected_subject}_{selected_chapter}_{st.session_state.uploader_generation}")
+            show_skipped_uploads()
+            if uploaded_files:
+                allow_duplicates = st.checkbox("Upload files even if the same content exists in another chapter",
+                                               key="upload_allow_duplicates")
+                if st.button(f"Upload Files ({len(uploaded_files)})"):
+                    progress_bar = st.progress(0, text="Uploading files...")
+                    uploaded, skipped, failures = upload_batch(
+                        selected_subject, selected_chapter, uploaded_files,
+                        on_progress=lambda done, total: progress_bar.progress(done / total, text=f"Uploaded {done} of {total} files"),
+                        allow_duplicates=allow_duplicates)
+                    progress_bar.empty()
+                    st.session_state.upload_skipped = skipped
+                    for filename, error in failures:
+                        st.error(f"Failed to upload '{filename}': {error}")
+                    if uploaded:
+                        st.success(f"{len(uploaded)} files uploaded successfully to S3.")
+                    if not failures:
+                        # A new uploader key clears the selected files
+                        st.session_state.uploader_generation += 1
+                        st.rerun()
 
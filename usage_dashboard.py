@@ -0,0 +1,48 @@
+import time
+import streamlit as st
+import usage_metrics
+
+PERIODS = {"Last 24 hours": 24 * 3600, "Last 7 days": 7 * 24 * 3600, "Last 30 days": 30 * 24 * 3600, "All time": None}
+
+
+def usage_dashboard():
+    with st.expander("📚 Click here for Tool Instructions"):
+        st.markdown("""
+        **How to use the Usage Dashboard:**
+        1. Choose the period to report on.
+        2. "By tool" shows calls, cache hits, p50/p95 latency, tokens and estimated cost for each tool.
+        3. "Top cost" and "Slowest calls" list the functions and individual calls that cost the most.
+        4. Costs are estimates from on-demand prices; cached responses cost nothing.
+        5. Failed calls (after all retries) and streams abandoned part way are counted under "errors" and "aborted".
+        """)
+    period = st.selectbox("Period", list(PERIODS), key="usage_dashboard_period")
+    seconds = PERIODS[period]
+    entries = usage_metrics.load(since=time.time() - seconds if seconds else None)
+    if not entries:
+        st.info("No model calls recorded for this period.")
+        return
+
+    by_tool = usage_metrics.summarize(entries, group_by='tool')
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Model calls", len(entries))
+    col2.metric("Failed / aborted", f"{sum(row['errors'] for row in by_tool):,} / "
+                                    f"{sum(row['aborted'] for row in by_tool):,}")
+    col3.metric("Tokens (in / out)", f"{sum(row['input_tokens'] for row in by_tool):,} / "
+                                     f"{sum(row['output_tokens'] for row in by_tool):,}")
+    col4.metric("Estimated cost", f"${sum(row['cost'] for row in by_tool):,.2f}")
+
+    st.subheader("By tool")
+    st.dataframe(by_tool, use_container_width=True, hide_index=True)
+
+    st.subheader("Top cost")
+    st.dataframe(usage_metrics.summarize(entries, group_by='caller')[:10], use_container_width=True, hide_index=True)
+
+    st.subheader("Slowest calls")
+    slowest = sorted((entry for entry in entries if not entry['cached']), key=lambda entry: entry['seconds'],
+                     reverse=True)[:10]
+    st.dataframe([{"caller": entry['caller'], "model_id": entry['model_id'], "seconds": entry['seconds'],
+                   "input_tokens": entry['input_tokens'], "output_tokens": entry['output_tokens'],
+                   "retries": entry['retries'],
+                   "outcome": entry.get('error') or ("aborted" if entry.get('aborted') else "ok"),
+                   "time": time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['time']))} for entry in slowest],
+                 use_container_width=True, hide_index=True)
@@ -0,0 +1,130 @@
+import os
+import json
+import math
+import time
+import inspect
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Append-only JSONL log with one line per model call: model ID, input/output tokens,
+# wall time, retries, whether the response cache answered, the error of a failed call or
+# whether a stream was abandoned, and the tool function that made the call. The Usage
+# Dashboard aggregates it per tool and per caller.
+USAGE_LOG_PATH = os.getenv('USAGE_LOG_PATH', os.path.join(tempfile.gettempdir(), 'aiforlecture-usage.jsonl'))
+
+# On-demand USD prices per 1000 input / output tokens; images are priced per call
+MODEL_PRICES = {
+    "anthropic.claude-3-sonnet-20240229-v1:0": (0.003, 0.015),
+    "anthropic.claude-v2": (0.008, 0.024),
+}
+IMAGE_PRICES = {
+    "stability.stable-diffusion-xl-v1": 0.04,
+}
+
+# Frames from these modules are skipped when looking for the calling tool function
+_INFRASTRUCTURE_MODULES = ('usage_metrics', 'bedrock_invoke', 'llm_cache', 'threading', 'concurrent.futures.thread',
+                           'tenacity', 'streamlit')
+
+_lock = threading.Lock()
+
+
+def find_caller():
+    # "module.function" of the nearest frame outside the invocation machinery
+    frame = inspect.currentframe()
+    try:
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if not module.startswith(_INFRASTRUCTURE_MODULES):
+                return f"{module}.{frame.f_code.co_name}"
+            frame = frame.f_back
+    finally:
+        del frame
+    return "unknown"
+
+
+def estimate_cost(model_id, input_tokens, output_tokens, cached=False):
+    if cached:
+        return 0.0
+    if model_id in IMAGE_PRICES:
+        return IMAGE_PRICES[model_id]
+    input_price, output_price = MODEL_PRICES.get(model_id, (0.0, 0.0))
+    return (input_tokens or 0) / 1000 * input_price + (output_tokens or 0) / 1000 * output_price
+
+
+def record(model_id, seconds, input_tokens=None, output_tokens=None, retries=0, cached=False, streamed=False,
+           caller=None, error=None, aborted=False):
+    # error is the error code of a call that failed; aborted marks a stream the consumer stopped reading
+    caller = caller or find_caller()
+    entry = {
+        "time": time.time(),
+        "model_id": model_id,
+        "tool": caller.split('.', 1)[0],
+        "caller": caller,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "seconds": round(seconds, 3),
+        "retries": retries,
+        "cached": cached,
+        "streamed": streamed,
+        "error": error,
+        "aborted": aborted,
+        "cost": round(estimate_cost(model_id, input_tokens, output_tokens, cached), 6),
+    }
+    line = json.dumps(entry) + "\n"
+    try:
+        with _lock, open(USAGE_LOG_PATH, 'a', encoding='utf-8') as log_file:
+            log_file.write(line)
+    except OSError:
+        # Instrumentation must never fail a model call
+        pass
+
+
+def load(since=None):
+    # Log entries, optionally only those newer than `since` (epoch seconds)
+    entries = []
+    try:
+        with open(USAGE_LOG_PATH, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or entry['time'] >= since:
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(entries, group_by='tool'):
+    # One row per group with call counts, latency percentiles, token totals and cost
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry[group_by], []).append(entry)
+    rows = []
+    for name, group in groups.items():
+        uncached = [entry for entry in group if not entry['cached']]
+        latencies = [entry['seconds'] for entry in uncached] or [0.0]
+        rows.append({
+            group_by: name,
+            "calls": len(group),
+            "cache_hits": len(group) - len(uncached),
+            "p50_seconds": percentile(latencies, 0.50),
+            "p95_seconds": percentile(latencies, 0.95),
+            "input_tokens": sum(entry['input_tokens'] or 0 for entry in group),
+            "output_tokens": sum(entry['output_tokens'] or 0 for entry in group),
+            "retries": sum(entry['retries'] for entry in group),
+            "errors": sum(1 for entry in group if entry.get('error')),
+            "aborted": sum(1 for entry in group if entry.get('aborted')),
+            "cost": round(sum(entry['cost'] for entry in group), 4),
+        })
+    return sorted(rows, key=lambda row: row['cost'], reverse=True)